@@ -1,12 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.upload_process_routes import router as upload_router
+from app.core.state_backend import state_backend
+from app.core.serialization import FastJSONResponse
+from app.services.uav_swarm_orchestrator import orchestrator
+from app.services.repair_verification import repair_verifier
 
 def create_app():
     app = FastAPI(
         title="ROADvision_Lagos: Infrastructure Guardian API", 
         description="AI-powered infrastructure governance for Nigeria. Created by David Akpoviroro Oke (MrIridescent)",
-        version="2.0.0"
+        version="2.0.0",
+        default_response_class=FastJSONResponse
     )
 
     # CORS middleware
@@ -19,6 +24,30 @@ def create_app():
     )
     api_prefix = "/api/v1"
 
+    @app.on_event("startup")
+    async def start_state_backend():
+        await state_backend.start()
+
+    @app.on_event("shutdown")
+    async def stop_state_backend():
+        await state_backend.stop()
+
+    @app.on_event("startup")
+    async def start_swarm_simulation():
+        orchestrator.start()
+
+    @app.on_event("shutdown")
+    async def stop_swarm_simulation():
+        orchestrator.stop()
+
+    @app.on_event("startup")
+    async def start_repair_verifier():
+        repair_verifier.start()
+
+    @app.on_event("shutdown")
+    async def stop_repair_verifier():
+        await repair_verifier.stop()
+
     @app.get("/")
     async def root():
         return {
@@ -0,0 +1,206 @@
+# app/core/frame_ring.py
+
+import logging
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.core.frame_source import open_frame_source
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RING_SLOTS = 8                # Frames in flight between decoder and inference
+RING_PUT_TIMEOUT = 1.0        # Producer re-checks for cancellation this often
+RING_GET_TIMEOUT = 30.0       # Consumer gives up if the decoder stalls this long
+
+# The decoder child only needs the frame source. "fork" avoids re-importing the `app`
+# package (and loading the YOLO model) in the child, which "spawn" would do.
+_CTX = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+
+
+class SharedFrameRing:
+    """Fixed-size ring of frame slots in shared memory.
+
+    Frames never cross a pipe: the producer writes into a slot's NumPy view and only the
+    slot index travels through `ready`. Consumers read the slot in place and hand the
+    index back through `free`, which recycles the slot. An empty `free` queue blocks the
+    producer, giving natural backpressure when inference falls behind.
+    """
+
+    def __init__(self, frame_shape, slots: int = RING_SLOTS, dtype=np.uint8, _attach=None):
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+        if _attach is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+            self.free = _CTX.Queue()
+            self.ready = _CTX.Queue()
+            for i in range(slots):
+                self.free.put(i)
+            self.owner = True
+        else:
+            name, self.free, self.ready = _attach
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.frames = np.ndarray((slots, *self.frame_shape), dtype=self.dtype, buffer=self.shm.buf)
+
+    def handle(self):
+        """Picklable description used by another process to attach to this ring"""
+        return (self.frame_shape, self.slots, self.dtype.str, (self.shm.name, self.free, self.ready))
+
+    @classmethod
+    def attach(cls, handle):
+        frame_shape, slots, dtype, attach = handle
+        return cls(frame_shape, slots, dtype, _attach=attach)
+
+    # Producer side
+    def acquire_slot(self, timeout=RING_PUT_TIMEOUT) -> int:
+        """Block until a slot is free (backpressure); raises queue.Empty on timeout"""
+        return self.free.get(timeout=timeout)
+
+    def publish(self, slot: int, frame_index: int):
+        self.ready.put((slot, frame_index))
+
+    def close_stream(self, error: str = None):
+        """Signal end of stream (or a decoder failure) to the consumer"""
+        self.ready.put((None, error))
+
+    # Consumer side
+    def next_frame(self, timeout=RING_GET_TIMEOUT):
+        """Return (slot, frame_index, view) or None at end of stream"""
+        slot, frame_index = self.ready.get(timeout=timeout)
+        if slot is None:
+            if frame_index:
+                raise Exception(f"Decoder failed: {frame_index}")
+            return None
+        return slot, frame_index, self.frames[slot]
+
+    def release_slot(self, slot: int):
+        self.free.put(slot)
+
+    def close(self):
+        """Detach (and unlink, if owner); safe to call more than once"""
+        shm, self.shm = self.shm, None
+        if shm is None:
+            return
+        # Drop our view before closing so the buffer has no exported pointers
+        self.frames = None
+        try:
+            shm.close()
+        except BufferError as e:
+            # A caller still holds a slot view; the mapping goes when that view does
+            logger.warning(f"Frame ring {shm.name} closed with live views: {e}")
+        finally:
+            if self.owner:
+                shm.unlink()
+
+
+def _decoder_worker(handle, video_path, roi_ratio, target_width, stop_event):
+    """Child process: decode frames straight into ring slots"""
+    ring = SharedFrameRing.attach(handle)
+    source = None
+    try:
+        source = open_frame_source(video_path, roi_ratio=roi_ratio, target_width=target_width)
+        for index, frame in enumerate(source):
+            slot = None
+            while slot is None:
+                if stop_event.is_set():
+                    return
+                try:
+                    slot = ring.acquire_slot()
+                except queue.Empty:
+                    continue
+            ring.frames[slot][...] = frame
+            ring.publish(slot, index)
+        ring.close_stream()
+    except Exception as e:
+        ring.close_stream(str(e) or type(e).__name__)
+    finally:
+        if source is not None:
+            source.release()
+        ring.close()
+
+
+class SharedMemoryFrameSource:
+    """Frame source that decodes in a separate process and yields zero-copy views.
+
+    Exposes the same interface as the in-process sources (fps, total_frames, width,
+    height, geometry, negotiate(), iteration, release()). Each yielded frame is a view
+    into shared memory that stays valid until the next frame is requested.
+    """
+
+    backend = "shared_memory"
+
+    def __init__(self, path: str, roi_ratio: float = 1.0, target_width=None, slots: int = RING_SLOTS):
+        self.path = path
+        self.roi_ratio = roi_ratio
+        self.slots = slots
+        self.ring = None
+        self.process = None
+        self.stop_event = _CTX.Event()
+
+        self.negotiate(target_width)
+
+    def negotiate(self, target_width=None):
+        """Probe metadata and fix the decoded frame shape; call before iteration starts.
+
+        The probe runs in-process; the decoder child opens its own source.
+        """
+        probe = open_frame_source(self.path, roi_ratio=self.roi_ratio, target_width=target_width)
+        self.fps = probe.fps
+        self.total_frames = probe.total_frames
+        self.width = probe.width
+        self.height = probe.height
+        self.decoder_backend = probe.backend
+        self.geometry = probe.geometry
+        self.target_width = target_width
+        first = next(iter(probe), None)
+        probe.release()
+        if first is None:
+            raise Exception("Could not decode video")
+        self.frame_shape = first.shape
+
+    def _start(self):
+        self.ring = SharedFrameRing(self.frame_shape, self.slots)
+        self.process = _CTX.Process(
+            target=_decoder_worker,
+            args=(self.ring.handle(), self.path, self.roi_ratio, self.target_width, self.stop_event),
+            daemon=True
+        )
+        self.process.start()
+
+    def __iter__(self):
+        self._start()
+        slot = None
+        try:
+            while True:
+                if slot is not None:
+                    self.ring.release_slot(slot)
+                    slot = None
+                item = self.ring.next_frame()
+                if item is None:
+                    break
+                slot, _, frame = item
+                yield frame
+                # No slot views left behind in this frame if the next read raises
+                frame = item = None
+        finally:
+            if slot is not None:
+                self.ring.release_slot(slot)
+
+    def release(self):
+        self.stop_event.set()
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        ring, self.ring = self.ring, None
+        if ring is not None:
+            ring.close()
@@ -0,0 +1,142 @@
+# app/core/frame_source.py
+
+import cv2
+import logging
+from dataclasses import dataclass
+
+try:
+    import av  # Optional: PyAV (FFmpeg bindings) for cropped / downscaled decode
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DECODER_BACKEND = "auto"      # "auto" (PyAV if installed), "pyav" or "opencv"
+MODEL_INPUT_WIDTH = 640       # Longest ROI side the detector actually consumes
+
+
+@dataclass
+class FrameGeometry:
+    """Maps decoded frame pixels back to source video pixels"""
+    crop_top: int = 0         # Source rows dropped above the ROI
+    scale: float = 1.0        # Decoded pixels per source pixel
+
+    def to_source(self, x1, y1, x2, y2):
+        """Convert an ROI-space box into full-frame source coordinates"""
+        s = self.scale
+        return (
+            int(x1 / s), int(y1 / s) + self.crop_top,
+            int(x2 / s), int(y2 / s) + self.crop_top
+        )
+
+
+def negotiate_geometry(width: int, height: int, roi_ratio: float, target_width=None):
+    """Pick the crop and decode size for the ROI the model will consume.
+
+    Returns (geometry, out_width, out_height). The crop offset is kept even so that
+    chroma-subsampled (yuv420) crops stay exact.
+    """
+    crop_top = int(height * (1 - roi_ratio)) & ~1
+    roi_h = height - crop_top
+    scale = 1.0
+    if target_width:
+        scale = min(1.0, target_width / max(width, roi_h))
+    out_w = max(2, int(width * scale) & ~1)
+    out_h = max(2, int(roi_h * scale) & ~1)
+    return FrameGeometry(crop_top=crop_top, scale=out_w / width), out_w, out_h
+
+
+class OpenCVFrameSource:
+    """cv2.VideoCapture decode. OpenCV cannot downscale inside the decoder, so only the
+    zero-copy ROI crop is applied and frames keep their source resolution."""
+
+    backend = "opencv"
+
+    def __init__(self, path: str, roi_ratio: float = 1.0, target_width=None):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise Exception("Could not open video")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.roi_ratio = roi_ratio
+        self.negotiate(target_width)
+
+    def negotiate(self, target_width=None):
+        """Only the crop can be negotiated with OpenCV"""
+        self.geometry, _, _ = negotiate_geometry(self.width, self.height, self.roi_ratio)
+
+    def __iter__(self):
+        top = self.geometry.crop_top
+        while self.cap.isOpened():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            yield frame[top:, :]
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVFrameSource:
+    """FFmpeg decode through PyAV with threaded decoding and a crop+scale filter graph,
+    so decode output scales with what the model actually consumes."""
+
+    backend = "pyav"
+
+    def __init__(self, path: str, roi_ratio: float = 1.0, target_width=None):
+        if av is None:
+            raise RuntimeError("PyAV is not installed")
+
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+
+        ctx = self.stream.codec_context
+        self.width = ctx.width
+        self.height = ctx.height
+        self.fps = float(self.stream.average_rate or 30.0)
+        self.total_frames = self.stream.frames
+        if not self.total_frames and self.stream.duration:
+            self.total_frames = int(float(self.stream.duration * self.stream.time_base) * self.fps)
+
+        self.roi_ratio = roi_ratio
+        self.negotiate(target_width)
+
+    def negotiate(self, target_width=None):
+        """(Re)build the crop+scale filter graph for the requested model input width"""
+        self.geometry, out_w, out_h = negotiate_geometry(self.width, self.height, self.roi_ratio, target_width)
+        roi_h = self.height - self.geometry.crop_top
+
+        self.graph = av.filter.Graph()
+        src = self.graph.add_buffer(template=self.stream)
+        crop = self.graph.add("crop", f"{self.width}:{roi_h}:0:{self.geometry.crop_top}")
+        scale = self.graph.add("scale", f"{out_w}:{out_h}:flags=area")
+        sink = self.graph.add("buffersink")
+        src.link_to(crop)
+        crop.link_to(scale)
+        scale.link_to(sink)
+        self.graph.configure()
+
+    def __iter__(self):
+        for frame in self.container.decode(self.stream):
+            self.graph.push(frame)
+            yield self.graph.pull().to_ndarray(format="bgr24")
+
+    def release(self):
+        self.container.close()
+
+
+def open_frame_source(path: str, roi_ratio: float = 1.0, target_width=None, backend: str = DECODER_BACKEND):
+    """Open the best available frame source for a video file"""
+    if backend == "pyav" or (backend == "auto" and av is not None):
+        try:
+            return PyAVFrameSource(path, roi_ratio, target_width)
+        except Exception as e:
+            if backend == "pyav":
+                raise
+            logger.warning(f"PyAV decode unavailable for {path}, falling back to OpenCV: {e}")
+    return OpenCVFrameSource(path, roi_ratio, target_width)
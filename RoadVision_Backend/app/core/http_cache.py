@@ -0,0 +1,122 @@
+# app/core/http_cache.py
+
+import gzip
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+
+from app.core.serialization import dumps
+from app.core.storage import run_io
+
+try:
+    import brotli  # Optional: better ratios than gzip for JSON on metered mobile links
+except ImportError:
+    brotli = None
+
+# Configuration
+COMPRESS_MIN_BYTES = 1024     # Smaller bodies are not worth the CPU or the header overhead
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _negotiate_encoding(accept_encoding: str, size: int) -> str:
+    if size < COMPRESS_MIN_BYTES:
+        return "identity"
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def _encode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+class _Representation:
+    def __init__(self, version, body: bytes):
+        self.version = version
+        self.body = body
+        self.encoded: Dict[str, bytes] = {"identity": body}
+
+
+class VersionedResponseCache:
+    """Conditional GET + cached compressed bodies for heavy read endpoints.
+
+    Each resource has a key and a version function derived from its store (file mtime,
+    scan counter, tick counter...). The ETag is built from the version, so a client that
+    already holds the current version gets a 304 without the payload being rebuilt.
+    Serialized and compressed bodies are kept until the version changes.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Representation] = {}
+
+    async def respond(
+        self,
+        request: Request,
+        key: str,
+        version_fn: Callable[[], object],
+        producer: Callable[[], Awaitable[object]]
+    ) -> Response:
+        version = version_fn()
+        etag = f'W/"{key}-{version}"'
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            content = await producer()
+            entry = _Representation(version, await run_io(dumps, content))
+            if version_fn() == version:
+                self._entries[key] = entry
+            else:
+                # The store moved while producing: the body may mix versions, so serve
+                # it once without an ETag and let the next request cache the new one
+                del headers["ETag"]
+
+        return await self._send(request, entry, headers)
+
+    async def respond_uncached(self, request: Request, content: object) -> Response:
+        """Compressed response with no ETag or cached body, for payloads that change on
+        nearly every request (a version would never match)"""
+        entry = _Representation(None, await run_io(dumps, content))
+        return await self._send(request, entry, {"Vary": "Accept-Encoding", "Cache-Control": "no-cache"})
+
+    @staticmethod
+    async def _send(request: Request, entry: _Representation, headers: Dict[str, str]) -> Response:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding", ""), len(entry.body))
+        payload = entry.encoded.get(encoding)
+        if payload is None:
+            payload = await run_io(_encode, entry.body, encoding)
+            entry.encoded[encoding] = payload
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        return Response(content=payload, media_type="application/json", headers=headers)
+
+
+response_cache = VersionedResponseCache()
@@ -0,0 +1,60 @@
+# app/core/serialization.py
+
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # In requirements.txt; several times faster than stdlib json for large payloads
+except ImportError:
+    orjson = None
+
+# Compact output everywhere unless pretty printing is explicitly requested
+PRETTY_JSON = os.getenv("ROADVISION_PRETTY_JSON", "0") == "1"
+
+
+def _default(obj):
+    """Encode the non-JSON types that show up in detection results"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, pretty: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when installed, NumPy-aware either way)"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    if pretty:
+        return json.dumps(obj, default=_default, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the shared serializer.
+
+    Returning an instance directly from a route also skips FastAPI's jsonable_encoder
+    pass, which matters for multi-megabyte result payloads.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,232 @@
+# app/core/state_backend.py
+"""
+Pluggable job state and pub/sub backend.
+
+"memory" keeps everything in this process (single node, the default). "sqlite:///path"
+shares job status, the results index and WebSocket messages between every backend
+process pointing at the same database file, so instances can sit behind a load balancer
+on one host (or on a shared volume) and a WebSocket on node B still sees node A's jobs.
+
+Select with the ROADVISION_STATE_BACKEND environment variable.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STATE_BACKEND_URL = os.getenv("ROADVISION_STATE_BACKEND", "memory")
+POLL_INTERVAL = 0.1           # Seconds between message-table polls (sqlite)
+MESSAGE_RETENTION = 300       # Seconds routed messages are kept (sqlite)
+
+Listener = Callable[[str, dict], None]
+
+
+class InMemoryStateBackend:
+    """Single-process backend: plain dicts and direct listener calls"""
+
+    shared = False
+
+    def __init__(self):
+        self._statuses: Dict[str, dict] = {}
+        self._results: Dict[str, dict] = {}
+        self._listeners: List[Listener] = []
+
+    # Job status
+    def get_status(self, video_id: str) -> Optional[dict]:
+        return self._statuses.get(video_id)
+
+    def set_status(self, video_id: str, status: dict):
+        self._statuses[video_id] = status
+
+    def delete_status(self, video_id: str):
+        self._statuses.pop(video_id, None)
+
+    def list_statuses(self) -> Dict[str, dict]:
+        return dict(self._statuses)
+
+    # Results index (summary + result file path)
+    def get_result_entry(self, video_id: str) -> Optional[dict]:
+        return self._results.get(video_id)
+
+    def put_result_entry(self, video_id: str, entry: dict):
+        self._results[video_id] = entry
+
+    # Pub/sub
+    def add_listener(self, listener: Listener):
+        self._listeners.append(listener)
+
+    def publish_many(self, messages: List[Tuple[str, dict]]):
+        for channel, payload in messages:
+            self._deliver(channel, payload)
+
+    def publish(self, channel: str, payload: dict):
+        self.publish_many([(channel, payload)])
+
+    def _deliver(self, channel: str, payload: dict):
+        for listener in self._listeners:
+            try:
+                listener(channel, payload)
+            except Exception as e:
+                logger.error(f"State listener failed on {channel}: {e}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SQLiteStateBackend(InMemoryStateBackend):
+    """Multi-process backend on a shared SQLite file (WAL mode).
+
+    Messages are appended to a table; every process polls it from its event loop and
+    delivers new rows to its local listeners, including rows it published itself.
+    Publishes from the event loop are written by one background thread, in order, so
+    the loop never waits on the database lock.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS job_status (video_id TEXT PRIMARY KEY, status TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS results_index (video_id TEXT PRIMARY KEY, entry TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+        """)
+        self._last_id = self._query_one("SELECT COALESCE(MAX(id), 0) FROM messages")[0]
+        self._poller = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-publish")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_one(self, sql: str, params=()):
+        rows = self._execute(sql, params)
+        return rows[0] if rows else None
+
+    def get_status(self, video_id: str) -> Optional[dict]:
+        row = self._query_one("SELECT status FROM job_status WHERE video_id = ?", (video_id,))
+        return json.loads(row[0]) if row else None
+
+    def set_status(self, video_id: str, status: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO job_status (video_id, status) VALUES (?, ?)",
+            (video_id, json.dumps(status))
+        )
+
+    def delete_status(self, video_id: str):
+        self._execute("DELETE FROM job_status WHERE video_id = ?", (video_id,))
+
+    def list_statuses(self) -> Dict[str, dict]:
+        return {vid: json.loads(s) for vid, s in self._execute("SELECT video_id, status FROM job_status")}
+
+    def get_result_entry(self, video_id: str) -> Optional[dict]:
+        row = self._query_one("SELECT entry FROM results_index WHERE video_id = ?", (video_id,))
+        return json.loads(row[0]) if row else None
+
+    def put_result_entry(self, video_id: str, entry: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO results_index (video_id, entry) VALUES (?, ?)",
+            (video_id, json.dumps(entry))
+        )
+
+    def publish_many(self, messages: List[Tuple[str, dict]]):
+        now = time.time()
+        rows = [(channel, json.dumps(payload), now) for channel, payload in messages]
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._insert_messages(rows)
+        else:
+            self._writer.submit(self._insert_logged, rows)
+
+    def _insert_messages(self, rows: List[tuple]):
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT INTO messages (channel, payload, created) VALUES (?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                # Leave the connection usable for the next publish
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+    def _insert_logged(self, rows: List[tuple]):
+        try:
+            self._insert_messages(rows)
+        except Exception as e:
+            logger.error(f"State backend publish failed: {e}")
+
+    def _fetch_new(self):
+        rows = self._execute(
+            "SELECT id, channel, payload FROM messages WHERE id > ? ORDER BY id", (self._last_id,)
+        )
+        if rows:
+            self._last_id = rows[-1][0]
+        return rows
+
+    def _prune(self):
+        self._execute("DELETE FROM messages WHERE created < ?", (time.time() - MESSAGE_RETENTION,))
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        last_prune = time.time()
+        while True:
+            try:
+                rows = await loop.run_in_executor(None, self._fetch_new)
+                for _, channel, payload in rows:
+                    self._deliver(channel, json.loads(payload))
+                if time.time() - last_prune > MESSAGE_RETENTION:
+                    await loop.run_in_executor(None, self._prune)
+                    last_prune = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"State backend poll failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def start(self):
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+
+def create_state_backend(url: str = STATE_BACKEND_URL):
+    """Build a backend from a URL: "memory" or "sqlite:///path/to/state.db" """
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        logger.info(f"Using shared SQLite state backend: {path}")
+        return SQLiteStateBackend(path)
+    if url != "memory":
+        logger.warning(f"Unknown state backend '{url}', using in-memory state")
+    return InMemoryStateBackend()
+
+
+state_backend = create_state_backend()
@@ -1,10 +1,22 @@
 # app/core/storage.py
 
 from pathlib import Path
-from typing import Dict, List
-import json
+from collections import deque
+from collections.abc import MutableMapping
+from typing import Dict, List, Optional, Set
+import asyncio
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from app.core.state_backend import state_backend
+from app.core.serialization import PRETTY_JSON, dumps, loads
+
 # Directory setup
 UPLOAD_DIR = Path("uploads")
 RESULTS_DIR = Path("results")
@@ -15,63 +27,361 @@ RESULTS_DIR.mkdir(exist_ok=True)
 DATA_DIR.mkdir(exist_ok=True)
 
 GLOBAL_MAP_FILE = DATA_DIR / "global_road_map.json"
-FEEDBACK_FILE = DATA_DIR / "live_feedback.json"
+FEEDBACK_FILE = DATA_DIR / "live_feedback.json"          # Legacy format, migrated on startup
+FEEDBACK_LOG_FILE = DATA_DIR / "live_feedback.jsonl"
+FEEDBACK_HISTORY_SIZE = 100
+FEEDBACK_FLUSH_INTERVAL = 0.5
+FEEDBACK_COMPACT_LINES = 1000
 REPORTS_DIR = DATA_DIR / "reports"
 REPORTS_DIR.mkdir(exist_ok=True)
 
-# In-memory storage for processing status and results
-processing_status: Dict[str, dict] = {}
+TERMINAL_STATUSES = ("completed", "error")
+STATUS_CHANNEL = "job-status"
+
+# Dedicated pool so disk I/O never runs on (or queues behind) the event loop
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-io")
+
+
+# --- File I/O layer ---------------------------------------------------------
+# Every service persists through these helpers. The plain functions block and are
+# meant for worker threads and service code; async route handlers use the `a*`
+# variants (or run_io for a whole service call) so the event loop never touches disk.
+
+def write_bytes_atomic(path: Path, data: bytes):
+    """Write a file via a temp file in the same directory + rename, so readers never
+    see a half-written file"""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def save_stream(path: Path, source):
+    """Copy a file-like object (e.g. an upload) to path in chunks; no partial file is left on failure"""
+    path = Path(path)
+    try:
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+
+def read_json(path: Path, default=None):
+    """Load a JSON file, returning `default` if it does not exist"""
+    path = Path(path)
+    if not path.exists():
+        return default
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def write_json(path: Path, data, pretty: bool = PRETTY_JSON):
+    """Atomically write JSON (compact unless pretty printing is requested)"""
+    write_bytes_atomic(path, dumps(data, pretty=pretty))
+
+
+def read_json_lines(path: Path) -> List:
+    """Load every record of a JSON-lines file (empty list if it does not exist)"""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'rb') as f:
+        return [loads(line) for line in f if line.strip()]
+
+
+def append_json_lines(path: Path, records):
+    """Append records to a JSON-lines file in a single write"""
+    with open(path, 'ab') as f:
+        f.write(b"".join(dumps(r) + b"\n" for r in records))
+
+
+def write_json_lines(path: Path, records):
+    """Atomically rewrite a JSON-lines file (used to compact append-only logs)"""
+    write_bytes_atomic(path, b"".join(dumps(r) + b"\n" for r in records))
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking (disk-bound) callable on the storage I/O pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, lambda: func(*args, **kwargs))
+
+
+def file_version(path: Path) -> str:
+    """Cheap content version of a file-backed store (changes on every atomic rewrite or append)"""
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return "0"
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+async def aread_json(path: Path, default=None):
+    return await run_io(read_json, path, default)
+
+
+async def awrite_json(path: Path, data, pretty: bool = PRETTY_JSON):
+    await run_io(write_json, path, data, pretty)
+
+
+async def asave_stream(path: Path, source):
+    await run_io(save_stream, path, source)
+
+
+class JobStatusMap(MutableMapping):
+    """dict-style view of job status held in the (possibly shared) state backend.
+
+    Values are snapshots: change a job's status with set_job_status/update_job_status,
+    not by mutating the returned dict.
+    """
+
+    def __getitem__(self, video_id: str) -> dict:
+        status = state_backend.get_status(video_id)
+        if status is None:
+            raise KeyError(video_id)
+        return status
+
+    def __setitem__(self, video_id: str, status: dict):
+        state_backend.set_status(video_id, status)
+
+    def __delitem__(self, video_id: str):
+        state_backend.delete_status(video_id)
+
+    def __iter__(self):
+        return iter(state_backend.list_statuses())
+
+    def __len__(self):
+        return len(state_backend.list_statuses())
+
+    def items(self):
+        return state_backend.list_statuses().items()
+
+
+# Job status lives in the state backend; detection results are cached per process and
+# located through the backend's results index
+processing_status = JobStatusMap()
 detection_results: Dict[str, dict] = {}
 
+
+class JobStatusEvents:
+    """Wakes async waiters when a job's status changes.
+
+    `notify` may be called from any thread (the video worker threads included); each
+    waiter is resolved on its own event loop.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._lock = threading.Lock()
+
+    def watch(self, video_id: str) -> asyncio.Future:
+        """Register interest in the next status change; await the returned future.
+
+        Register *before* reading the current status so a change in between is not missed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.setdefault(video_id, set()).add(future)
+        future.add_done_callback(lambda f: self._discard(video_id, f))
+        return future
+
+    def _discard(self, video_id: str, future: asyncio.Future):
+        with self._lock:
+            waiters = self._waiters.get(video_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[video_id]
+
+    def notify(self, video_id: str):
+        with self._lock:
+            waiters = list(self._waiters.get(video_id, ()))
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(_resolve_waiter, future)
+
+
+def _resolve_waiter(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+job_events = JobStatusEvents()
+
+
+def _on_backend_message(channel: str, payload: dict):
+    if channel == STATUS_CHANNEL:
+        job_events.notify(payload["video_id"])
+
+
+state_backend.add_listener(_on_backend_message)
+
+
+def set_job_status(video_id: str, **status):
+    """Replace a job's status and wake anyone waiting on it (on every node)"""
+    processing_status[video_id] = status
+    state_backend.publish(STATUS_CHANNEL, {"video_id": video_id})
+
+
+async def aset_job_status(video_id: str, **status):
+    """set_job_status for event-loop callers (the state write runs on the I/O pool)"""
+    await run_io(processing_status.__setitem__, video_id, status)
+    state_backend.publish(STATUS_CHANNEL, {"video_id": video_id})
+
+
+def update_job_status(video_id: str, **fields):
+    """Update fields of a job's status and wake anyone waiting on it (on every node)"""
+    status = dict(processing_status.get(video_id, {}))
+    status.update(fields)
+    set_job_status(video_id, **status)
+
+
+def record_result(video_id: str, results: dict, result_path: Path):
+    """Cache results locally and index them so any node can serve /results"""
+    detection_results[video_id] = results
+    state_backend.put_result_entry(video_id, {
+        "path": str(result_path),
+        "summary": results.get("summary")
+    })
+
+
+def get_result_summary(video_id: str) -> Optional[dict]:
+    if video_id in detection_results:
+        return detection_results[video_id]["summary"]
+    entry = state_backend.get_result_entry(video_id)
+    return entry["summary"] if entry else None
+
+
+def get_result_path(video_id: str) -> Path:
+    entry = state_backend.get_result_entry(video_id)
+    return Path(entry["path"]) if entry else RESULTS_DIR / f"{video_id}.json"
+
+_global_map_lock = threading.Lock()
+
 def update_global_map(new_detections: list, video_id: str):
     """Update the crowdsourced global road health map with persistent storage"""
     try:
-        data = {"potholes": [], "stats": {"total_detected": 0, "last_update": ""}}
-        if GLOBAL_MAP_FILE.exists():
-            with open(GLOBAL_MAP_FILE, 'r') as f:
-                data = json.load(f)
-        
-        for d in new_detections:
-            d["video_id"] = video_id
-            data["potholes"].append(d)
-            
-        data["stats"]["total_detected"] = len(data["potholes"])
-        data["stats"]["last_update"] = datetime.now().isoformat()
+        # Several videos can finish at once on the worker pool
+        with _global_map_lock:
+            data = read_json(GLOBAL_MAP_FILE, {"potholes": [], "stats": {"total_detected": 0, "last_update": ""}})
             
-        with open(GLOBAL_MAP_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+            for d in new_detections:
+                d["video_id"] = video_id
+                data["potholes"].append(d)
+                
+            data["stats"]["total_detected"] = len(data["potholes"])
+            data["stats"]["last_update"] = datetime.now().isoformat()
+                
+            write_json(GLOBAL_MAP_FILE, data)
     except Exception as e:
         print(f"Global map update failed: {e}")
 
-def add_live_feedback(user: str, message: str):
-    """Save persistent real-time feedback messages"""
-    try:
-        data: List[dict] = []
-        if FEEDBACK_FILE.exists():
-            with open(FEEDBACK_FILE, 'r') as f:
-                data = json.load(f)
-        
-        new_entry = {
+class FeedbackStore:
+    """Command Link history with write-behind persistence.
+
+    An in-memory ring buffer of the last FEEDBACK_HISTORY_SIZE messages is the source of
+    truth, so adding a message or reading history on connect never touches the disk. A
+    background flusher appends pending messages to a JSON-lines log in batches and
+    compacts the log back down to the ring buffer once it grows past
+    FEEDBACK_COMPACT_LINES.
+    """
+
+    def __init__(self, log_file: Path, legacy_file: Path = None):
+        self.log_file = log_file
+        self.legacy_file = legacy_file
+        self.history = deque(maxlen=FEEDBACK_HISTORY_SIZE)
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()        # Guards history + pending (held briefly)
+        self._io_lock = threading.Lock()     # Serialises log writes
+        self._wakeup = threading.Event()
+        self._log_lines = 0
+        self._load()
+        self._thread = threading.Thread(target=self._flush_loop, name="feedback-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _load(self):
+        try:
+            if self.log_file.exists():
+                entries = read_json_lines(self.log_file)
+                self.history.extend(entries)
+                self._log_lines = len(entries)
+            elif self.legacy_file is not None and self.legacy_file.exists():
+                # One-off migration from the old rewrite-everything JSON file
+                self.history.extend(read_json(self.legacy_file, []))
+                self._compact()
+        except Exception as e:
+            print(f"Feedback history load failed: {e}")
+
+    def add(self, user: str, message: str) -> dict:
+        entry = {
             "id": str(datetime.now().timestamp()),
             "user": user,
             "message": message,
             "timestamp": datetime.now().isoformat()
         }
-        data.append(new_entry)
-        
-        # Keep only last 100 messages
-        data = data[-100:]
-        
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-        return new_entry
-    except Exception as e:
-        print(f"Feedback storage failed: {e}")
-        return None
+        with self._lock:
+            self.history.append(entry)
+            self._pending.append(entry)
+        self._wakeup.set()
+        return entry
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return list(self.history)
+
+    def flush(self):
+        """Append pending messages to the log in one write; compact when it grows too long"""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                append_json_lines(self.log_file, batch)
+                self._log_lines += len(batch)
+                if self._log_lines > FEEDBACK_COMPACT_LINES:
+                    self._compact()
+            except Exception as e:
+                print(f"Feedback storage failed: {e}")
+
+    def _compact(self):
+        """Rewrite the log to just the ring buffer (write-then-rename)"""
+        # The snapshot already holds anything still pending, so take both in one step
+        with self._lock:
+            entries = list(self.history)
+            pending, self._pending = self._pending, []
+        try:
+            write_json_lines(self.log_file, entries)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+        self._log_lines = len(entries)
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            # Let a burst of messages accumulate into one batch
+            time.sleep(FEEDBACK_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+feedback_store = FeedbackStore(FEEDBACK_LOG_FILE, legacy_file=FEEDBACK_FILE)
+
+
+def add_live_feedback(user: str, message: str):
+    """Save a real-time feedback message (persisted write-behind)"""
+    return feedback_store.add(user, message)
 
 def get_live_feedback():
-    """Retrieve feedback history"""
-    if FEEDBACK_FILE.exists():
-        with open(FEEDBACK_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    """Retrieve feedback history (served from memory)"""
+    return feedback_store.snapshot()
@@ -1,68 +1,235 @@
 # app/routes/upload_process_routes.py
 
-from fastapi import APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional, Union
 import asyncio
+import math
+import time
 from app.services.upload_service import UploadService
 from app.services.video_processor import VideoProcessor
 from app.ws.websocket_manager import manager
+from app.core.serialization import FastJSONResponse, dumps
+from app.core.http_cache import response_cache
 from app.core.storage import (
     processing_status, 
     detection_results, 
     GLOBAL_MAP_FILE, 
-    DATA_DIR, 
+    REPORTS_DIR, 
     add_live_feedback, 
-    get_live_feedback
+    get_live_feedback,
+    get_result_summary,
+    job_events,
+    TERMINAL_STATUSES,
+    run_io,
+    aread_json,
+    awrite_json,
+    file_version
 )
-import json
 from pathlib import Path
 from datetime import datetime
 
 from app.services.satellite_sentinel import satellite_sentinel
-from app.services.flood_correlation import flood_service
+from app.services.satellite_analyzer import satellite_sentinel as satellite_analyzer, GRID_CELL_DEG
+from app.services.flood_correlation import flood_service, RISK_TOP_K, SWEEP_MAX_VALUES
 from app.services.contractor_audit import contractor_audit
 from app.services.uav_swarm_orchestrator import orchestrator
+from app.services.uav_telemetry import decode_batch, records_from_dicts
+from app.services.spatial_join import spatial_join, JOIN_FLOOD_RAINFALL_MM, JOIN_MAX_RADIUS_M
 
 router = APIRouter()
 
 @router.get("/uav/swarm-status")
-async def get_uav_swarm_status():
+async def get_uav_swarm_status(request: Request):
     """COORDINATED UAV SWARM: Real-time mapping and monitoring of Lagos LGAs"""
-    orchestrator.update_swarm_status()
-    return orchestrator.get_summary()
+    # No ETag: sim time and battery move every tick, so a cached version never matches
+    return await response_cache.respond_uncached(request, orchestrator.get_summary())
 
 @router.get("/uav/critical-alerts")
 async def get_uav_critical_alerts():
     """COORDINATED UAV SWARM: Immediate alerts for severe road failures"""
     return orchestrator.get_critical_alerts()
 
+@router.post("/uav/telemetry")
+async def ingest_uav_telemetry(request: Request):
+    """Batched drone telemetry: packed TELEMETRY_DTYPE records (application/octet-stream)
+    or a JSON list of {"uav_id", "lat", "lon", "battery", "status", "issue", "ts"}"""
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            records = records_from_dicts(await request.json(), orchestrator.index)
+        else:
+            records = decode_batch(await request.body())
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid telemetry batch: {e}")
+    # A few vectorized array writes: cheaper inline than a thread hop
+    return orchestrator.ingest_telemetry(records)
+
+@router.get("/uav/{uav_id}/track")
+async def get_uav_track(uav_id: str):
+    """Recent reported positions of one drone"""
+    track = orchestrator.get_track(uav_id)
+    if track is None:
+        raise HTTPException(status_code=404, detail=f"Unknown UAV '{uav_id}'")
+    return track
+
 @router.get("/city/flood-risk")
 async def get_flood_risk(region: str = "Lekki", rainfall_mm: float = 50.0):
     """NICHE LEADER: Correlate rainfall and topography with pothole formation"""
     return flood_service.calculate_erosion_risk(region, rainfall_mm)
 
-@router.post("/audit/verify-repair")
-async def verify_repair(contractor_id: str, pothole_id: str):
-    """NICHE LEADER: AI verification of contractor repairs"""
-    return contractor_audit.submit_repair(contractor_id, pothole_id, "before.jpg", "after.jpg")
+@router.get("/city/flood-risk-sweep")
+async def get_flood_risk_sweep(
+    rain_min: float = 10.0,
+    rain_max: float = 200.0,
+    rain_step: float = 10.0,
+    regions: Optional[List[str]] = Query(None),
+    include_zones: bool = False
+):
+    """Storm planning: risk for a range of rainfall values x regions in one call"""
+    if not all(map(math.isfinite, (rain_min, rain_max, rain_step))) or rain_step <= 0 or rain_max < rain_min:
+        raise HTTPException(status_code=400, detail="Invalid rainfall range")
+    # Size the sweep before building it: the range comes straight from the query string
+    steps = (rain_max - rain_min) / rain_step + 1e-9
+    if not steps < SWEEP_MAX_VALUES:
+        raise HTTPException(status_code=400, detail=f"Sweep needs between 1 and {SWEEP_MAX_VALUES} rainfall values")
+    count = int(steps) + 1
+    try:
+        sweep = flood_service.sweep(
+            [round(rain_min + i * rain_step, 6) for i in range(count)], regions, include_zones
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(sweep)
+
+class FloodScenario(BaseModel):
+    """Rainfall scenario for the city-wide risk surface.
+
+    rainfall_mm: a total, a time series, a per-cell field or a field time series.
+    elevation / drainage_quality: optional custom grid (e.g. a DEM); defaults to Lagos.
+    """
+    rainfall_mm: Union[float, List[float], List[List[float]], List[List[List[float]]]] = 50.0
+    elevation: Optional[List[List[float]]] = None
+    drainage_quality: Optional[List[List[float]]] = None
+    top_k: int = RISK_TOP_K
+    include_raster: bool = True
+
+@router.post("/city/flood-risk-surface")
+async def get_flood_risk_surface(scenario: FloodScenario):
+    """Erosion risk for every grid cell in one vectorized pass, plus top-K incubation zones"""
+    if (scenario.elevation is None) != (scenario.drainage_quality is None):
+        raise HTTPException(status_code=400, detail="elevation and drainage_quality must be given together")
+    try:
+        surface = flood_service.risk_surface(
+            scenario.rainfall_mm, scenario.elevation, scenario.drainage_quality, scenario.top_k
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not scenario.include_raster:
+        surface = {k: v for k, v in surface.items() if k != "risk"}
+    return FastJSONResponse(surface)
+
+@router.post("/audit/verify-repair", status_code=202)
+async def verify_repair(
+    contractor_id: str,
+    video_id: str,
+    pothole_id: int,
+    after_image: UploadFile = File(...),
+    before_image: Optional[UploadFile] = File(None)
+):
+    """NICHE LEADER: AI verification of contractor repairs (queued; poll the job or watch the Command Link)"""
+    return await contractor_audit.submit_repair(contractor_id, video_id, pothole_id, after_image, before_image)
+
+@router.get("/audit/verify-repair/{job_id}")
+async def get_repair_verification(job_id: str):
+    """Status / verdict of a queued repair verification"""
+    return contractor_audit.get_verification(job_id)
+
+@router.get("/audit/ledger")
+async def get_audit_ledger(
+    contractor_id: Optional[str] = None,
+    pothole_id: Optional[int] = None,
+    video_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Audit ledger entries, newest first (indexed by contractor_id / pothole_id)"""
+    if contractor_id is None and pothole_id is None:
+        return await run_io(contractor_audit.get_audit_summary, limit)
+    return await run_io(contractor_audit.find_audits, contractor_id, pothole_id, video_id, limit)
+
+@router.get("/audit/ledger/verify")
+async def verify_audit_ledger(full: bool = False):
+    """Check the ledger's SHA-256 chain (incrementally from the last checkpoint unless full)"""
+    return await run_io(contractor_audit.verify_ledger, full)
 
 @router.get("/satellite/city-health")
-async def get_lagos_city_health():
+async def get_lagos_city_health(request: Request):
     """NOVEL: Get city-wide infrastructure health report from satellite data"""
-    return satellite_sentinel.get_city_wide_health()
+    return await response_cache.respond(
+        request, "city-health",
+        lambda: satellite_sentinel.version,
+        lambda: run_io(satellite_sentinel.get_city_wide_health)
+    )
 
 @router.get("/satellite/scan")
-async def scan_lagos_region(region: str = "Ikeja"):
-    """Scan specific Lagos region via satellite sentinel"""
-    return satellite_sentinel.scan_region(region)
+async def scan_lagos_region(region: str = "Ikeja", change_detection: bool = True):
+    """Scan specific Lagos region via satellite sentinel (only changed imagery tiles are reprocessed)"""
+    try:
+        return await run_io(satellite_sentinel.scan_region, region, change_detection)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/satellite/grid-scan")
+async def scan_lagos_grid(cell_deg: float = GRID_CELL_DEG):
+    """Concurrent city grid scan, streamed as NDJSON (one line per cell as it finishes)"""
+    if cell_deg <= 0:
+        raise HTTPException(status_code=400, detail="cell_deg must be positive")
+    try:
+        total = len(satellite_analyzer.grid_cells(cell_deg))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        started = time.monotonic()
+        hazards = 0
+        async for scan in satellite_analyzer.scan_grid(cell_deg):
+            hazards += scan["sentinel_status"] == "IDENTIFIED"
+            yield dumps(scan) + b"\n"
+        yield dumps({
+            "type": "summary",
+            "cells": total,
+            "hazards": hazards,
+            "elapsed_seconds": round(time.monotonic() - started, 2)
+        }) + b"\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 upload_service = UploadService()
 video_processor = VideoProcessor()
 
 
 @router.post("/upload")
-async def upload_video(file: UploadFile = File(...), speed_kmh: int = 30):
-    """Upload video and start background processing"""
-    return await upload_service.upload_video(file, speed_kmh)
+async def upload_video(
+    file: UploadFile = File(...),
+    speed_kmh: int = 30,
+    compact_results: bool = False,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    end_lat: Optional[float] = None,
+    end_lon: Optional[float] = None
+):
+    """Upload video and start background processing.
+
+    compact_results stores per-pothole track summaries instead of the full per-frame log.
+    lat/lon (and optionally end_lat/end_lon) geotag the drive so potholes can be joined
+    against flood-risk cells and satellite failures.
+    """
+    if (lat is None) != (lon is None) or (end_lat is None) != (end_lon is None):
+        raise HTTPException(status_code=400, detail="Coordinates must be given as lat/lon pairs")
+    if lat is None and end_lat is not None:
+        raise HTTPException(status_code=400, detail="end_lat/end_lon require lat/lon")
+    geotag = {"lat": lat, "lon": lon, "end_lat": end_lat, "end_lon": end_lon} if lat is not None else None
+    return await upload_service.upload_video(file, speed_kmh, compact_results, geotag)
 
 
 @router.get("/status/{video_id}")
@@ -74,35 +241,51 @@ async def get_status(video_id: str):
 @router.get("/results/{video_id}")
 async def get_results(video_id: str):
     """Get detection results for a processed video"""
-    return await video_processor.get_results(video_id)
+    return FastJSONResponse(await video_processor.get_results(video_id))
 
 
 @router.get("/videos")
 async def list_videos():
     """List all processed videos"""
-    videos = []
-    for video_id, status in processing_status.items():
-        video_info = {
-            "video_id": video_id,
-            "status": status["status"],
-            "progress": status["progress"]
-        }
-        
-        if video_id in detection_results:
-            video_info["summary"] = detection_results[video_id]["summary"]
-        
-        videos.append(video_info)
+    def collect():
+        videos = []
+        for video_id, status in processing_status.items():
+            video_info = {
+                "video_id": video_id,
+                "status": status["status"],
+                "progress": status["progress"]
+            }
+            
+            summary = get_result_summary(video_id)
+            if summary is not None:
+                video_info["summary"] = summary
+            
+            videos.append(video_info)
+        return videos
     
-    return {"videos": videos}
+    return {"videos": await run_io(collect)}
 
 
 @router.get("/analytics/global-map")
-async def get_global_map():
+async def get_global_map(request: Request):
     """NOVEL: Get aggregated pothole data for global visualization"""
-    if GLOBAL_MAP_FILE.exists():
-        with open(GLOBAL_MAP_FILE, 'r') as f:
-            return json.load(f)
-    return {"potholes": [], "stats": {"total_detected": 0}}
+    return await response_cache.respond(
+        request, "global-map",
+        lambda: file_version(GLOBAL_MAP_FILE),
+        lambda: aread_json(GLOBAL_MAP_FILE, {"potholes": [], "stats": {"total_detected": 0}})
+    )
+
+
+@router.get("/analytics/hazard-join")
+async def get_hazard_join(
+    radius_m: float = 200.0,
+    sources: Optional[List[str]] = Query(None),
+    rainfall_mm: float = JOIN_FLOOD_RAINFALL_MM
+):
+    """Geotagged potholes within radius_m of a high-risk flood cell and/or satellite failure"""
+    if not 0 < radius_m <= JOIN_MAX_RADIUS_M:
+        raise HTTPException(status_code=400, detail=f"radius_m must be in (0, {JOIN_MAX_RADIUS_M:g}]")
+    return FastJSONResponse(await run_io(spatial_join.query, radius_m, sources, rainfall_mm))
 
 
 @router.get("/city/report/{video_id}")
@@ -121,11 +304,10 @@ async def generate_city_report(video_id: str):
         "recommendation": "IMMEDIATE REPAIR" if results.get("urgency_score", 0) > 70 else "SCHEDULED MAINTENANCE"
     }
     
-    report_path = DATA_DIR / "reports" / f"report_{video_id}.json"
-    with open(report_path, 'w') as f:
-        json.dump(report, f, indent=2)
+    report_path = REPORTS_DIR / f"report_{video_id}.json"
+    await awrite_json(report_path, report)
         
-    return report
+    return FastJSONResponse(report)
 
 
 @router.post("/dispatch/repair")
@@ -155,12 +337,12 @@ async def dispatch_repair_bot(pothole_id: int, location: str = "Unknown"):
 @router.websocket("/ws/command-link")
 async def command_link_endpoint(websocket: WebSocket):
     """NOVEL: Global Command Link for real-time peer-to-peer communication and system logs"""
-    await manager.connect_command_link(websocket)
+    subscriber = await manager.connect_command_link(websocket)
     
     try:
         # Send history on connect
         history = get_live_feedback()
-        await websocket.send_json({
+        subscriber.send({
             "type": "history",
             "messages": history
         })
@@ -181,58 +363,79 @@ async def command_link_endpoint(websocket: WebSocket):
                 })
                 
     except WebSocketDisconnect:
-        manager.disconnect_command_link(websocket)
+        manager.disconnect_command_link(subscriber)
     except Exception as e:
         print(f"Command Link Error: {e}")
-        manager.disconnect_command_link(websocket)
+        manager.disconnect_command_link(subscriber)
+
+
+@router.websocket("/ws/uav-telemetry")
+async def uav_telemetry_endpoint(websocket: WebSocket):
+    """Streaming drone telemetry: each binary frame is a batch of packed records.
+    Frames are not acknowledged individually; bad frames get an error message."""
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_bytes()
+            try:
+                orchestrator.ingest_telemetry(decode_batch(payload))
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"UAV Telemetry Link Error: {e}")
 
 
 @router.websocket("/ws/{video_id}")
 async def websocket_endpoint(websocket: WebSocket, video_id: str):
     """WebSocket for real-time processing updates"""
     
-    await manager.connect(video_id, websocket)
+    subscriber = await manager.connect(video_id, websocket)
+    receive = asyncio.ensure_future(websocket.receive_text())
     
     try:
         # Send initial status if available
-        if video_id in processing_status:
-            await websocket.send_json({
+        status = await run_io(processing_status.get, video_id)
+        if status is not None:
+            subscriber.send({
                 "type": "status",
-                **processing_status[video_id]
+                **status
             })
         
-        # Keep connection alive and wait for processing to complete
-        while True:
-            # Check if processing is done
-            if video_id in processing_status:
-                status = processing_status[video_id]["status"]
-                if status in ["completed", "error"]:
-                    # Send final status and close gracefully
-                    await websocket.send_json({
-                        "type": "status",
-                        **processing_status[video_id]
-                    })
-                    break
+        # Wait for status-change events (no polling) until processing completes
+        while not subscriber.closed:
+            changed = job_events.watch(video_id)
             
-            # Keep connection alive with a ping/pong mechanism
-            try:
-                # Wait for any message from client (like ping) with timeout
-                await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
-            except asyncio.TimeoutError:
-                # Send a heartbeat to keep connection alive
-                try:
-                    await websocket.send_json({"type": "heartbeat"})
-                except:
-                    break
-            except:
+            # Check if processing is done
+            status = await run_io(processing_status.get, video_id) or {}
+            if status.get("status") in TERMINAL_STATUSES:
+                changed.cancel()
+                # Send final status and close gracefully
+                subscriber.send({
+                    "type": "status",
+                    **status
+                })
+                await subscriber.flush()
                 break
             
-            # Small delay to prevent busy loop
-            await asyncio.sleep(0.1)
+            # Wake on a status change, a client message (like ping) or the heartbeat timeout
+            done, _ = await asyncio.wait(
+                {receive, changed}, timeout=30.0, return_when=asyncio.FIRST_COMPLETED
+            )
+            changed.cancel()
+            
+            if receive in done:
+                receive.result()  # Raises WebSocketDisconnect when the client leaves
+                receive = asyncio.ensure_future(websocket.receive_text())
+            elif not done:
+                # Send a heartbeat to keep connection alive
+                subscriber.send({"type": "heartbeat"})
     
     except WebSocketDisconnect:
         pass
     except Exception as e:
         print(f"WebSocket error for {video_id}: {e}")
     finally:
-        manager.disconnect(video_id)
\ No newline at end of file
+        receive.cancel()
+        manager.disconnect(video_id, subscriber)
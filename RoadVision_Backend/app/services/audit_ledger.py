@@ -0,0 +1,306 @@
+# app/services/audit_ledger.py
+"""
+Append-only, SHA-256 hash-chained audit ledger.
+
+Each entry is one JSON line carrying its sequence number, the previous entry's hash
+and its own hash: SHA-256 over the previous hash and the entry's canonical JSON (sorted
+keys, no whitespace, stdlib json so the bytes never depend on an optional encoder).
+Appends go straight to the open file; a flusher thread fsyncs them and append() returns
+once its entry is on disk. Entries appended while an fsync is running all ride on the
+next one, so concurrent submissions share fsyncs without any added latency.
+
+An in-memory index maps contractor_id and pothole_id to line offsets, so lookups read
+only the matching lines. Chain verification resumes from a checkpoint (sequence, file
+offset and hash of the last verified entry) and only hashes entries appended since.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from app.core.storage import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LEDGER_QUERY_LIMIT = 1000
+GENESIS_HASH = "0" * 64
+
+HASH_FIELDS = ("prev_hash", "ledger_hash")
+
+
+def canonical_bytes(entry: Dict) -> bytes:
+    body = {k: v for k, v in entry.items() if k not in HASH_FIELDS}
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+def chain_hash(prev_hash: str, entry: Dict) -> str:
+    return hashlib.sha256(prev_hash.encode() + canonical_bytes(entry)).hexdigest()
+
+
+class AuditLedger:
+    """Hash-chained JSON-lines ledger with group-committed fsyncs and lookup indexes"""
+
+    def __init__(self, path: Path, legacy_file: Path = None):
+        self.path = path
+        self.legacy_file = legacy_file
+        self.checkpoint_file = path.with_suffix(".checkpoint.json")
+        self.seq = 0
+        self.head_hash = GENESIS_HASH
+        self.by_contractor: Dict[str, List[int]] = {}
+        self.by_pothole: Dict[str, List[int]] = {}
+        self._offset = 0
+        self._lock = threading.Lock()           # Guards the chain head, indexes and file writes
+        self._durable = threading.Condition(self._lock)
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._sync_error = None                 # Last failed flush and the seq it covered
+        self._failed_seq = 0
+        self._wakeup = threading.Event()
+        self.fsyncs = 0
+        self._verify_lock = threading.Lock()     # One verification (and checkpoint write) at a time
+        self._load()
+        self._file = open(self.path, "ab")
+        self._thread = threading.Thread(target=self._sync_loop, name="audit-ledger-fsync", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    # --- Load / migrate -------------------------------------------------------------
+
+    def _load(self):
+        """Rebuild head and indexes from the ledger (migrating the legacy JSON log)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            self.path.touch()
+            legacy = read_json(self.legacy_file, []) if self.legacy_file is not None else []
+            if legacy:
+                # One-off migration; the old "ledger_hash" came from hash() and is dropped
+                with open(self.path, "ab") as f:
+                    for entry in legacy:
+                        f.write(self._seal({k: v for k, v in entry.items() if k != "ledger_hash"})[1])
+                    f.flush()
+                    os.fsync(f.fileno())
+        else:
+            with open(self.path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Only the last line can be unterminated: a torn write from a crash.
+                        # Cut it off and carry on from there
+                        logger.warning(f"Audit ledger: dropping torn tail at byte {offset}")
+                        break
+                    try:
+                        entry = json.loads(line)
+                        seq, ledger_hash = entry["seq"], entry["ledger_hash"]
+                    except (ValueError, KeyError, TypeError):
+                        # Damaged entry inside the file: leave it for verify() to report
+                        logger.error(f"Audit ledger: unreadable entry at byte {offset}; run a full verification")
+                        offset += len(line)
+                        continue
+                    self._index(entry, offset)
+                    self.seq = seq
+                    self.head_hash = ledger_hash
+                    offset += len(line)
+            if offset != self.path.stat().st_size:
+                os.truncate(self.path, offset)
+            self._offset = offset
+        self._written_seq = self._synced_seq = self.seq
+
+    def _index(self, entry: Dict, offset: int):
+        self.by_contractor.setdefault(entry.get("contractor_id"), []).append(offset)
+        self.by_pothole.setdefault(str(entry.get("pothole_id")), []).append(offset)
+
+    def _seal(self, entry: Dict) -> Tuple[Dict, bytes]:
+        """Chain one entry onto the head; returns it and its line (caller holds the lock or is loading)"""
+        entry = {**entry, "seq": self.seq + 1}
+        entry["prev_hash"] = self.head_hash
+        entry["ledger_hash"] = chain_hash(self.head_hash, entry)
+        line = (json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode()
+        self._index(entry, self._offset)
+        self.seq = entry["seq"]
+        self.head_hash = entry["ledger_hash"]
+        self._offset += len(line)
+        return entry, line
+
+    # --- Append -----------------------------------------------------------------------
+
+    def append(self, entry: Dict, durable: bool = True) -> Dict:
+        """Add an entry; returns it with seq/prev_hash/ledger_hash once fsynced (if durable).
+
+        Raises OSError if the fsync covering the entry failed; the entry is in the file
+        but may not survive a crash.
+        """
+        with self._lock:
+            sealed, line = self._seal(entry)
+            self._file.write(line)
+            self._written_seq = sealed["seq"]
+            self._wakeup.set()
+            while durable and self._synced_seq < sealed["seq"]:
+                if self._sync_error is not None and self._failed_seq >= sealed["seq"]:
+                    raise OSError(f"Audit entry {sealed['seq']} not durable: {self._sync_error}")
+                self._durable.wait()
+        return sealed
+
+    def flush(self):
+        """Write and fsync everything appended so far (raises if that fails)"""
+        with self._lock:
+            target = self._written_seq
+            if self._synced_seq >= target:
+                return
+            try:
+                self._file.flush()
+                fd = self._file.fileno()
+            except OSError as e:
+                self._fail(e, target)
+                raise
+        # fsync outside the lock so appends keep queueing behind it
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            with self._lock:
+                self._fail(e, target)
+            raise
+        with self._lock:
+            self._synced_seq = max(self._synced_seq, target)
+            self._sync_error = None
+            self.fsyncs += 1
+            self._durable.notify_all()
+
+    def _fail(self, error: OSError, target: int):
+        """Wake appenders waiting on entries up to target so they raise instead of hanging
+        (caller holds the lock); later appends retry the fsync"""
+        self._sync_error = error
+        self._failed_seq = max(self._failed_seq, target)
+        self._durable.notify_all()
+
+    def _sync_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit ledger fsync failed: {e}")
+
+    # --- Lookups ----------------------------------------------------------------------
+
+    def _flush_buffer(self) -> int:
+        """Hand buffered appends to the OS so readers see them (no fsync needed for that);
+        returns the end offset of the last complete entry"""
+        with self._lock:
+            self._file.flush()
+            return self._offset
+
+    def _read_at(self, offsets: List[int]) -> List[Dict]:
+        self._flush_buffer()
+        entries = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def find(self, contractor_id: str = None, pothole_id=None, video_id: str = None,
+             limit: int = LEDGER_QUERY_LIMIT) -> List[Dict]:
+        """Entries for a contractor and/or pothole, newest first"""
+        with self._lock:
+            candidates = None
+            if contractor_id is not None:
+                candidates = set(self.by_contractor.get(contractor_id, ()))
+            if pothole_id is not None:
+                matches = set(self.by_pothole.get(str(pothole_id), ()))
+                candidates = matches if candidates is None else candidates & matches
+            if candidates is None:
+                raise ValueError("Filter by contractor_id and/or pothole_id")
+        entries = self._read_at(sorted(candidates, reverse=True))
+        if video_id is not None:
+            entries = [e for e in entries if e.get("video_id") == video_id]
+        return entries[:limit]
+
+    def tail(self, limit: int = LEDGER_QUERY_LIMIT) -> List[Dict]:
+        """Most recent entries, newest first (reads backwards from the end of the file)"""
+        self._flush_buffer()
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block, data = 1 << 16, b""
+            while end > 0 and data.count(b"\n") <= limit:
+                start = max(0, end - block)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+        lines = data.splitlines()[-limit:] if limit else []
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue    # Damaged entry; verify() reports it
+        return entries
+
+    # --- Verification ------------------------------------------------------------------
+
+    def verify(self, full: bool = False) -> Dict:
+        """Check the hash chain from the last checkpoint (or from genesis if full).
+
+        Only entries after the checkpoint are hashed; of the earlier ones just the
+        checkpointed entry is re-checked, so a periodic full=True pass is still the audit.
+        """
+        with self._verify_lock:
+            return self._verify(full)
+
+    def _verify(self, full: bool) -> Dict:
+        end = self._flush_buffer()
+        checkpoint = {"seq": 0, "offset": 0, "entry_offset": None, "hash": GENESIS_HASH}
+        if not full:
+            checkpoint = read_json(self.checkpoint_file, checkpoint)
+        seq, offset, prev_hash = checkpoint["seq"], checkpoint["offset"], checkpoint["hash"]
+        entry_offset = checkpoint["entry_offset"]
+        checked = 0
+        error = None
+        with open(self.path, "rb") as f:
+            # The checkpointed entry must still be there, unchanged, to resume after it
+            if entry_offset is not None:
+                f.seek(entry_offset)
+                line = f.readline()
+                try:
+                    anchor = json.loads(line)
+                except ValueError:
+                    anchor = {}
+                if f.tell() != offset or anchor.get("ledger_hash") != prev_hash:
+                    error = f"Checkpointed entry {seq} was altered; run a full verification"
+            f.seek(offset)
+            while error is None and offset < end:
+                line = f.readline()
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    error = f"Unreadable entry after seq {seq}"
+                    break
+                if entry.get("seq") != seq + 1 or entry.get("prev_hash") != prev_hash:
+                    error = f"Chain broken at seq {seq + 1}"
+                elif chain_hash(prev_hash, entry) != entry.get("ledger_hash"):
+                    error = f"Hash mismatch at seq {entry['seq']}"
+                if error:
+                    break
+                seq, prev_hash, entry_offset = entry["seq"], entry["ledger_hash"], offset
+                offset += len(line)
+                checked += 1
+        if seq > checkpoint["seq"]:
+            # Everything up to the first bad entry is still verified
+            write_json(self.checkpoint_file, {
+                "seq": seq, "offset": offset, "entry_offset": entry_offset, "hash": prev_hash
+            })
+        return {
+            "valid": error is None,
+            "error": error,
+            "verified_through_seq": seq,
+            "checked_entries": checked,
+            "from_seq": checkpoint["seq"],
+            "head_hash": prev_hash
+        }
@@ -5,54 +5,109 @@ Created by David Akpoviroro Oke (MrIridescent)
 AI-Verified Infrastructure Accountability for Lagos State
 """
 
-import json
+import re
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.storage import aread_json, get_result_path, run_io
+from app.services.audit_ledger import AuditLedger, LEDGER_QUERY_LIMIT
+from app.services.repair_verification import repair_verifier, save_image, discard_images
+from app.ws.websocket_manager import manager
+
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
 
 class ContractorAuditPortal:
     def __init__(self):
         self.audit_dir = Path("data/audit")
         self.audit_dir.mkdir(parents=True, exist_ok=True)
-        self.audit_log_file = self.audit_dir / "audit_log.json"
+        # Append-only hash-chained ledger; the old rewrite-everything JSON log is migrated
+        self.ledger = AuditLedger(self.audit_dir / "audit_ledger.jsonl", legacy_file=self.audit_dir / "audit_log.json")
+        repair_verifier.listeners.append(self._on_verified)
 
-    def submit_repair(self, contractor_id: str, pothole_id: str, before_img_id: str, after_img_id: str) -> Dict:
+    async def submit_repair(self, contractor_id: str, video_id: str, pothole_id: int, after_image: UploadFile,
+                            before_image: Optional[UploadFile] = None) -> Dict:
         """
-        AI Verification of pothole repair.
-        Compares original detection data with contractor's "After" footage.
+        Queue AI verification of a pothole repair.
+        The original detection (bbox, best frame) comes from the video's results; the
+        verdict is written to the audit log and pushed on the Command Link when the
+        batch containing it has run. Poll with get_verification.
         """
-        # Simulation: AI verification logic
-        # In production, this would re-run YOLO on the 'After' image
-        verification_status = "VERIFIED" # Simulated
-        maintenance_quality = 98 # Simulated
-        
+        detection = await self._find_detection(video_id, pothole_id)
+
+        # Only store photos for a known detection, under generated names
+        saved = []
+        try:
+            saved.append(await run_io(save_image, after_image))
+            if before_image is not None:
+                saved.append(await run_io(save_image, before_image))
+            return repair_verifier.submit({
+                "contractor_id": contractor_id,
+                "video_id": video_id,
+                "pothole_id": pothole_id,
+                **detection,
+                "after_image": saved[0],
+                "before_image": saved[1] if len(saved) > 1 else None
+            })
+        except Exception:
+            await run_io(discard_images, saved)
+            raise
+
+    async def _find_detection(self, video_id: str, pothole_id: int) -> Dict:
+        """Best-frame bbox of a confirmed pothole track, in source video pixels"""
+        results = None
+        if VIDEO_ID_PATTERN.match(video_id):
+            results = await aread_json(await run_io(get_result_path, video_id))
+        if results is None:
+            raise HTTPException(status_code=404, detail="Results not found")
+        track = next((t for t in results.get("tracks") or [] if t["pothole_id"] == pothole_id), None)
+        if track is None:
+            raise HTTPException(status_code=404, detail=f"Pothole {pothole_id} not found in video {video_id}")
+        info = results.get("video_info", {})
+        return {
+            "bbox": track["best_frame"]["bbox"],
+            "frame_id": track["best_frame"]["frame_id"],
+            "frame_size": (info["width"], info["height"]) if info.get("width") and info.get("height") else None,
+            "video_path": results["video_path"]
+        }
+
+    def get_verification(self, job_id: str) -> Dict:
+        job = repair_verifier.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Verification job not found")
+        return job
+
+    async def _on_verified(self, job: Dict):
+        if job["status"] != "completed":
+            await manager.broadcast_command_link({"type": "repair_verification", **job})
+            return
+        result = job["result"]
         audit_entry = {
-            "audit_id": f"AUDIT-{contractor_id[:4]}-{datetime.now().timestamp()}",
-            "contractor_id": contractor_id,
-            "pothole_id": pothole_id,
-            "verification_status": verification_status,
-            "maintenance_quality": maintenance_quality,
-            "completed_at": datetime.now().isoformat(),
-            "ledger_hash": f"SHA256-{hash(contractor_id + pothole_id)}"
+            "audit_id": f"AUDIT-{job['contractor_id'][:4]}-{datetime.now().timestamp()}",
+            "job_id": job["job_id"],
+            "contractor_id": job["contractor_id"],
+            "video_id": job["video_id"],
+            "pothole_id": job["pothole_id"],
+            "verification_status": result["verification_status"],
+            "maintenance_quality": result["maintenance_quality"],
+            "completed_at": job["completed_at"]
         }
-        
-        self._log_audit(audit_entry)
-        return audit_entry
-
-    def _log_audit(self, entry: Dict):
-        log = []
-        if self.audit_log_file.exists():
-            with open(self.audit_log_file, "r") as f:
-                log = json.load(f)
-        
-        log.append(entry)
-        with open(self.audit_log_file, "w") as f:
-            json.dump(log, f, indent=2)
-
-    def get_audit_summary(self) -> List:
-        if self.audit_log_file.exists():
-            with open(self.audit_log_file, "r") as f:
-                return json.load(f)
-        return []
+        # Returns once the entry's group fsync is done; the ledger adds seq and hashes
+        audit_entry = await run_io(self.ledger.append, audit_entry)
+        await manager.broadcast_command_link({"type": "repair_verification", **job, "audit": audit_entry})
+
+    def get_audit_summary(self, limit: int = LEDGER_QUERY_LIMIT) -> List:
+        """Most recent audit entries, newest first"""
+        return self.ledger.tail(limit)
+
+    def find_audits(self, contractor_id: Optional[str] = None, pothole_id: Optional[int] = None,
+                    video_id: Optional[str] = None, limit: int = LEDGER_QUERY_LIMIT) -> List:
+        """Indexed lookup by contractor and/or pothole (video_id narrows pothole ids)"""
+        return self.ledger.find(contractor_id, pothole_id, video_id, limit)
+
+    def verify_ledger(self, full: bool = False) -> Dict:
+        return self.ledger.verify(full)
 
 contractor_audit = ContractorAuditPortal()
@@ -0,0 +1,191 @@
+# app/services/coverage_planner.py
+"""
+Coverage planning for the UAV swarm.
+
+Each LGA is split into a grid of coverage cells that need a fixed amount of scanning
+(drone-seconds) to be covered. Drones that need a task (charged at base, or airborne
+with a finished cell) are matched to open cell slots with a min-cost assignment
+(scipy's linear_sum_assignment) over travel time and battery use, skipping pairs the
+battery cannot complete and return from. Far cells are credited so long trips start
+early, and each extra drone on a cell costs more than the last.
+
+Replanning is incremental: only drones that need a task and cells with free slots enter
+the cost matrix, at most ASSIGN_BATCH drones per round, and columns are pruned to the
+cheapest candidates, so a round stays bounded (tens of milliseconds at worst, usually
+about one) as fleet and cell counts grow.
+"""
+
+import time
+from typing import Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Configuration
+CELLS_PER_LGA_SIDE = 4          # Coverage grid per LGA (side x side cells)
+COVERAGE_RADIUS_DEG = 0.02      # Half-width of the area covered around each LGA centroid
+CELL_SCAN_SECONDS = 600.0       # Drone-seconds of scanning to cover one cell
+SLOT_SCAN_SECONDS = 150.0       # Remaining work per concurrent drone slot on a cell
+MAX_UAVS_PER_CELL = 4
+SLOT_PENALTY = 600.0            # Cost (s) added per drone already on a cell
+FAR_CELL_WEIGHT = 1.0           # Credit per second of the cell's distance from base
+MIN_SCAN_SECONDS = 120.0        # A task must leave at least this much scanning time
+ASSIGN_BATCH = 128              # Drones matched per planning round
+COLUMN_FACTOR = 4               # Candidate slots kept per drone in a round
+BATTERY_WEIGHT = 600.0          # Seconds of travel one full battery's worth of use is worth
+INFEASIBLE = 1e12
+METERS_PER_DEG = 111320.0
+
+STRATEGIES = ("optimal", "random")
+
+
+class CoveragePlanner:
+    """Coverage cells plus task assignment.
+
+    "optimal" runs the min-cost assignment across all LGAs. "random" reproduces the
+    original behaviour for comparison: each drone only works uncovered cells of the
+    LGA it was randomly given.
+    """
+
+    def __init__(self, centroids: np.ndarray, base: Tuple[float, float], speed_mps: float,
+                 reserve: float, strategy: str = "optimal", rng=None,
+                 cells_per_side: int = CELLS_PER_LGA_SIDE, radius_deg: float = COVERAGE_RADIUS_DEG):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown coverage strategy '{strategy}'")
+        self.strategy = strategy
+        self.base = base
+        self.speed_mps = speed_mps
+        self.reserve = reserve
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.n_lgas = len(centroids)
+
+        k = cells_per_side
+        offsets = (np.arange(k) + 0.5) / k * 2 * radius_deg - radius_deg
+        d_lat, d_lon = np.meshgrid(offsets, offsets, indexing="ij")
+        self.cell_lat = (centroids[:, 0, None] + d_lat.ravel()).ravel()
+        self.cell_lon = (centroids[:, 1, None] + d_lon.ravel()).ravel()
+        self.cell_lga = np.repeat(np.arange(self.n_lgas), k * k)
+        self.cell_half_deg = radius_deg / k
+        self.remaining = np.full(self.cell_lat.size, CELL_SCAN_SECONDS)
+        self.assigned = np.zeros(self.cell_lat.size, dtype=np.int32)
+        self._lga_work = np.bincount(self.cell_lga, minlength=self.n_lgas) * CELL_SCAN_SECONDS
+        self._home_m = np.hypot(self.cell_lat - base[0], self.cell_lon - base[1]) * METERS_PER_DEG
+
+        self.rounds = 0
+        self.last_plan_ms = 0.0
+        self.max_plan_ms = 0.0
+
+    # --- Coverage state --------------------------------------------------------
+
+    @property
+    def n_cells(self) -> int:
+        return self.cell_lat.size
+
+    @property
+    def open_cells(self) -> int:
+        return int(np.count_nonzero(self.remaining > 0))
+
+    @property
+    def fully_covered(self) -> bool:
+        return not self.open_cells
+
+    def record_scan(self, cells: np.ndarray, dt: float):
+        """Credit dt seconds of scanning to each listed cell (one entry per drone)"""
+        if cells.size:
+            work = np.bincount(cells, minlength=self.n_cells) * dt
+            np.maximum(self.remaining - work, 0.0, out=self.remaining)
+
+    def completed(self, cells: np.ndarray) -> np.ndarray:
+        return self.remaining[cells] <= 0
+
+    def release(self, cells: np.ndarray):
+        """Drones left these cells (finished, or heading home)"""
+        cells = cells[cells >= 0]
+        if cells.size:
+            np.subtract.at(self.assigned, cells, 1)
+
+    def progress_by_lga(self) -> np.ndarray:
+        """Mapping completion (%) per LGA"""
+        done = np.bincount(self.cell_lga, weights=CELL_SCAN_SECONDS - self.remaining, minlength=self.n_lgas)
+        return done / self._lga_work * 100
+
+    # --- Assignment ------------------------------------------------------------
+
+    def assign(self, lat: np.ndarray, lon: np.ndarray, battery: np.ndarray, drain: np.ndarray,
+               home_lga: np.ndarray) -> np.ndarray:
+        """Cell for each candidate drone (-1 if none this round); marks the slots taken"""
+        started = time.perf_counter()
+        result = np.full(lat.size, -1, dtype=np.int64)
+        if lat.size:
+            if self.strategy == "random":
+                self._assign_random(result, home_lga)
+            else:
+                self._assign_optimal(result, lat, lon, battery, drain)
+            taken = result[result >= 0]
+            if taken.size:
+                np.add.at(self.assigned, taken, 1)
+        self.rounds += 1
+        self.last_plan_ms = (time.perf_counter() - started) * 1000
+        self.max_plan_ms = max(self.max_plan_ms, self.last_plan_ms)
+        return result
+
+    def _open_slots(self) -> np.ndarray:
+        """One column per free drone slot on every uncovered cell"""
+        open_cells = np.nonzero(self.remaining > 0)[0]
+        capacity = np.minimum(MAX_UAVS_PER_CELL, np.ceil(self.remaining[open_cells] / SLOT_SCAN_SECONDS))
+        free = (capacity - self.assigned[open_cells]).astype(np.int64)
+        keep = free > 0
+        columns = np.repeat(open_cells[keep], free[keep])
+        # Rank of each slot on its cell: 0 for the first free slot, 1 for the next...
+        starts = np.repeat(np.cumsum(free[keep]) - free[keep], free[keep])
+        rank = np.arange(columns.size) - starts + self.assigned[columns]
+        return columns, rank
+
+    def _assign_optimal(self, result: np.ndarray, lat, lon, battery, drain):
+        columns, rank = self._open_slots()
+        if not columns.size:
+            return
+        rows = np.arange(lat.size)[:ASSIGN_BATCH]
+
+        go_m = np.hypot(
+            lat[rows, None] - self.cell_lat[columns], lon[rows, None] - self.cell_lon[columns]
+        ) * METERS_PER_DEG
+        flight_s = (go_m + self._home_m[columns]) / self.speed_mps
+        need = (flight_s + MIN_SCAN_SECONDS) * drain[rows, None]
+        usable = battery[rows, None] - self.reserve
+        # Travel and battery use, less a credit for far cells so the longest trips start
+        # first (makespan), plus a rising penalty for doubling up on one cell
+        cost = (
+            (go_m - FAR_CELL_WEIGHT * self._home_m[columns]) / self.speed_mps
+            + BATTERY_WEIGHT * need / 100.0
+            + SLOT_PENALTY * rank
+        )
+        cost[need > usable] = INFEASIBLE
+
+        # Prune to the cheapest candidate slots; the assignment only needs a few per drone
+        limit = COLUMN_FACTOR * rows.size
+        if columns.size > limit:
+            keep = np.argpartition(cost.min(axis=0), limit)[:limit]
+            cost, columns = cost[:, keep], columns[keep]
+
+        r, c = linear_sum_assignment(cost)
+        ok = cost[r, c] < INFEASIBLE
+        result[rows[r[ok]]] = columns[c[ok]]
+
+    def _assign_random(self, result: np.ndarray, home_lga: np.ndarray):
+        """Baseline: a random uncovered cell of the drone's own LGA"""
+        open_mask = self.remaining > 0
+        for i, lga in enumerate(home_lga):
+            candidates = np.nonzero(open_mask & (self.cell_lga == lga))[0]
+            if candidates.size:
+                result[i] = self.rng.choice(candidates)
+
+    def summary(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "cells": self.n_cells,
+            "cells_covered": self.n_cells - self.open_cells,
+            "planning_rounds": self.rounds,
+            "last_plan_ms": round(self.last_plan_ms, 3),
+            "max_plan_ms": round(self.max_plan_ms, 3)
+        }
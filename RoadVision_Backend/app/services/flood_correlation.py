@@ -5,54 +5,268 @@ Created by David Akpoviroro Oke (MrIridescent)
 Predictive Erosion Modeling for Sub-Saharan Infrastructure
 """
 
+import hashlib
 import random
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+# Configuration
+LAGOS_BOUNDS = {"lat": (6.40, 6.70), "lon": (3.10, 3.60)}
+FLOOD_GRID_DEG = 0.005          # Risk surface cell size (~550 m)
+RISK_TOP_K = 10                 # Incubation zones returned per surface
+RISK_ZONE_THRESHOLD = 60.0      # Cells above this score can become incubation zones
+RISK_CACHE_SIZE = 32            # Surfaces kept, keyed by an input digest
+IDW_POWER = 2.0                 # Inverse-distance weighting for the default topography grid
+SWEEP_MAX_VALUES = 1000         # Rainfall values per sweep
+DEFAULT_TOPOGRAPHY = {"elevation": 10, "drainage_quality": 0.5}
 
 class FloodCorrelationService:
     def __init__(self):
         # Simulation of Lagos Topography (Elevation in meters)
         self.LAGOS_TOPOGRAPHY = {
-            "Lekki": {"elevation": 2, "drainage_quality": 0.3},
-            "Ikeja": {"elevation": 15, "drainage_quality": 0.6},
-            "Oshodi": {"elevation": 10, "drainage_quality": 0.4},
-            "Ikorodu": {"elevation": 25, "drainage_quality": 0.5},
-            "Victoria Island": {"elevation": 1, "drainage_quality": 0.2}
+            "Lekki": {"elevation": 2, "drainage_quality": 0.3, "lat": 6.4584, "lon": 3.6015},
+            "Ikeja": {"elevation": 15, "drainage_quality": 0.6, "lat": 6.5965, "lon": 3.3421},
+            "Oshodi": {"elevation": 10, "drainage_quality": 0.4, "lat": 6.5540, "lon": 3.3400},
+            "Ikorodu": {"elevation": 25, "drainage_quality": 0.5, "lat": 6.6194, "lon": 3.5105},
+            "Victoria Island": {"elevation": 1, "drainage_quality": 0.2, "lat": 6.4281, "lon": 3.4219}
         }
+        self._grid = None
+        self._static_terms: Dict[str, float] = {}
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _static_term(self, region: str) -> float:
+        """Memoized topography part of the risk heuristic (elevation + drainage), which
+        does not depend on rainfall"""
+        term = self._static_terms.get(region)
+        if term is None:
+            topog = self.LAGOS_TOPOGRAPHY.get(region, DEFAULT_TOPOGRAPHY)
+            elevation_factor = max(0, (30 - topog["elevation"]) / 30)
+            drainage_factor = (1 - topog["drainage_quality"])
+            term = self._static_terms[region] = elevation_factor * 0.4 + drainage_factor * 0.4
+        return term
+
+    @staticmethod
+    def _incubation_zones(region: str, risk_score: float) -> List[Dict]:
+        """Predicted pothole incubation zones, seeded by (region, score) so the same
+        scenario always yields the same zones (and responses stay cacheable)"""
+        if risk_score <= 60:
+            return []
+        seed = hashlib.blake2b(f"{region}:{risk_score:.2f}".encode(), digest_size=8).digest()
+        rng = random.Random(int.from_bytes(seed, "big"))
+        return [
+            {
+                "zone_id": f"FLOOD-{region[:3]}-{i}",
+                "risk_level": "CRITICAL" if risk_score > 80 else "HIGH",
+                "type": "Erosion Incubation",
+                "recommendation": "Emergency Drain Clearing"
+            }
+            for i in range(rng.randint(2, 6))
+        ]
+
+    def _cached(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _store(self, key: str, value: Dict):
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > RISK_CACHE_SIZE:
+                self._cache.popitem(last=False)
 
     def calculate_erosion_risk(self, region: str, rainfall_mm: float) -> Dict:
         """
         Calculate the risk of new pothole formation based on flood vulnerability.
         Niche Logic: Low elevation + Poor drainage + High rainfall = High Erosion Risk.
         """
-        topog = self.LAGOS_TOPOGRAPHY.get(region, {"elevation": 10, "drainage_quality": 0.5})
-        
-        # Risk Heuristic
-        elevation_factor = max(0, (30 - topog["elevation"]) / 30)
-        drainage_factor = (1 - topog["drainage_quality"])
+        # Risk Heuristic (topography terms are memoized per region)
         rainfall_factor = min(1, rainfall_mm / 100)
-        
-        risk_score = (elevation_factor * 0.4 + drainage_factor * 0.4 + rainfall_factor * 0.2) * 100
-        
-        # Predicted pothole incubation zones
-        incubation_zones = []
-        if risk_score > 60:
-            num_zones = random.randint(2, 6)
-            for i in range(num_zones):
-                incubation_zones.append({
-                    "zone_id": f"FLOOD-{region[:3]}-{i}",
-                    "risk_level": "CRITICAL" if risk_score > 80 else "HIGH",
-                    "type": "Erosion Incubation",
-                    "recommendation": "Emergency Drain Clearing"
-                })
+        risk_score = (self._static_term(region) + rainfall_factor * 0.2) * 100
 
         return {
             "region": region,
             "risk_score": round(risk_score, 2),
             "status": "DANGER" if risk_score > 70 else "STABLE",
-            "incubation_zones": incubation_zones,
+            "incubation_zones": self._incubation_zones(region, round(risk_score, 2)),
             "analysis_time": datetime.now().isoformat(),
             "strategy": "Flood-Pothole Correlation (MrIridescent Engine)"
         }
 
+    # --- City-wide risk surface ------------------------------------------------
+
+    @property
+    def grid(self) -> Dict:
+        """Default Lagos grid: elevation/drainage interpolated (IDW) from the region anchors"""
+        if self._grid is None:
+            lat_min, lat_max = LAGOS_BOUNDS["lat"]
+            lon_min, lon_max = LAGOS_BOUNDS["lon"]
+            lats = lat_max - (np.arange(round((lat_max - lat_min) / FLOOD_GRID_DEG)) + 0.5) * FLOOD_GRID_DEG
+            lons = lon_min + (np.arange(round((lon_max - lon_min) / FLOOD_GRID_DEG)) + 0.5) * FLOOD_GRID_DEG
+
+            anchors = list(self.LAGOS_TOPOGRAPHY.values())
+            a_lat = np.array([a["lat"] for a in anchors])
+            a_lon = np.array([a["lon"] for a in anchors])
+            d2 = (lats[:, None, None] - a_lat) ** 2 + (lons[None, :, None] - a_lon) ** 2
+            weights = 1.0 / np.maximum(d2, 1e-12) ** (IDW_POWER / 2)
+            weights /= weights.sum(axis=-1, keepdims=True)
+
+            self._grid = {
+                "lats": lats,
+                "lons": lons,
+                "elevation": weights @ np.array([a["elevation"] for a in anchors], dtype=np.float64),
+                "drainage_quality": weights @ np.array([a["drainage_quality"] for a in anchors], dtype=np.float64)
+            }
+        return self._grid
+
+    @staticmethod
+    def _digest(*arrays: np.ndarray, extra: str = "") -> str:
+        h = hashlib.blake2b(extra.encode(), digest_size=16)
+        for a in arrays:
+            a = np.ascontiguousarray(a, dtype=np.float64)
+            h.update(str(a.shape).encode())
+            h.update(a.data)
+        return h.hexdigest()
+
+    @staticmethod
+    def risk_raster(elevation: np.ndarray, drainage_quality: np.ndarray, rainfall_mm: np.ndarray) -> np.ndarray:
+        """Vectorized form of the calculate_erosion_risk heuristic, for every cell at once.
+
+        Inputs broadcast against each other, so scalars, per-cell fields and stacks of
+        scenarios (extra leading axes) all work.
+        """
+        elevation_factor = np.maximum(0, (30 - elevation) / 30)
+        drainage_factor = 1 - drainage_quality
+        rainfall_factor = np.minimum(1, rainfall_mm / 100)
+        return (elevation_factor * 0.4 + drainage_factor * 0.4 + rainfall_factor * 0.2) * 100
+
+    def risk_surface(self, rainfall_mm: Union[float, List, np.ndarray],
+                     elevation: Optional[np.ndarray] = None, drainage_quality: Optional[np.ndarray] = None,
+                     top_k: int = RISK_TOP_K) -> Dict:
+        """Erosion risk for every grid cell plus the top-K incubation zones.
+
+        rainfall_mm is a scalar, a time series (T,) of per-interval totals, a field (H, W)
+        or a field time series (T, H, W); series are summed over time. Elevation and
+        drainage default to the built-in Lagos grid. Results are cached by an input
+        digest, so repeated scenarios cost a dictionary lookup.
+        """
+        grid = self.grid if elevation is None and drainage_quality is None else None
+        if grid is not None:
+            elevation, drainage_quality = grid["elevation"], grid["drainage_quality"]
+        else:
+            elevation = np.asarray(elevation, dtype=np.float64)
+            drainage_quality = np.asarray(drainage_quality, dtype=np.float64)
+        if elevation.shape != drainage_quality.shape or elevation.ndim != 2:
+            raise ValueError("elevation and drainage_quality must be 2-D grids of the same shape")
+
+        rainfall = np.asarray(rainfall_mm, dtype=np.float64)
+        if rainfall.ndim == 1 or rainfall.ndim == 3:
+            rainfall = rainfall.sum(axis=0)
+        if rainfall.ndim not in (0, 2) or (rainfall.ndim == 2 and rainfall.shape != elevation.shape):
+            raise ValueError(f"rainfall must be a scalar, a series, or a field of shape {elevation.shape}")
+
+        key = self._digest(elevation, drainage_quality, rainfall, extra=f"surface:{top_k}")
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        risk = self.risk_raster(elevation, drainage_quality, rainfall)
+        surface = {
+            "shape": list(risk.shape),
+            "bounds": {"lat": list(LAGOS_BOUNDS["lat"]), "lon": list(LAGOS_BOUNDS["lon"])} if grid else None,
+            "cell_deg": FLOOD_GRID_DEG if grid else None,
+            "stats": {
+                "mean_risk": round(float(risk.mean()), 2),
+                "max_risk": round(float(risk.max()), 2),
+                "cells_danger": int(np.count_nonzero(risk > 70)),
+                "cells_total": int(risk.size)
+            },
+            "incubation_zones": self._top_zones(risk, top_k, grid),
+            "risk": risk.astype(np.float32).round(2)
+        }
+
+        self._store(key, surface)
+        return surface
+
+    @staticmethod
+    def _top_zones(risk: np.ndarray, top_k: int, grid: Optional[Dict]) -> List[Dict]:
+        """Top-K cells above RISK_ZONE_THRESHOLD, highest first (argpartition, no full sort)"""
+        flat = risk.ravel()
+        k = min(top_k, flat.size)
+        if k <= 0:
+            return []
+        idx = np.argpartition(flat, -k)[-k:]
+        idx = idx[np.argsort(-flat[idx])]
+        zones = []
+        for i in idx:
+            score = float(flat[i])
+            if score <= RISK_ZONE_THRESHOLD:
+                break
+            row, col = np.unravel_index(i, risk.shape)
+            zone = {
+                "zone_id": f"FLOOD-CELL-{row}-{col}",
+                "cell": [int(row), int(col)],
+                "risk_score": round(score, 2),
+                "risk_level": "CRITICAL" if score > 80 else "HIGH",
+                "type": "Erosion Incubation",
+                "recommendation": "Emergency Drain Clearing"
+            }
+            if grid is not None:
+                zone["lat"] = round(float(grid["lats"][row]), 6)
+                zone["lon"] = round(float(grid["lons"][col]), 6)
+            zones.append(zone)
+        return zones
+
+    # --- Rainfall scenario sweep ------------------------------------------------
+
+    def sweep(self, rainfall_values: List[float], regions: Optional[List[str]] = None,
+              include_zones: bool = False) -> Dict:
+        """Risk for every (region, rainfall) pair in one vectorized evaluation.
+
+        Matches calculate_erosion_risk cell for cell, including its (deterministic)
+        incubation zones, without recomputing topography per value. Cached by inputs.
+        """
+        regions = list(regions or self.LAGOS_TOPOGRAPHY)
+        rainfall = np.asarray(rainfall_values, dtype=np.float64)
+        if rainfall.ndim != 1 or not 0 < rainfall.size <= SWEEP_MAX_VALUES:
+            raise ValueError(f"Sweep needs between 1 and {SWEEP_MAX_VALUES} rainfall values")
+
+        key = self._digest(rainfall, extra=f"sweep:{include_zones}:" + "|".join(regions))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        static = np.array([self._static_term(r) for r in regions])
+        risk = (static[:, None] + np.minimum(1, rainfall[None, :] / 100) * 0.2) * 100
+        # Status compares the unrounded score, as calculate_erosion_risk does
+        danger = risk > 70
+        risk = risk.round(2)
+
+        first_danger = {
+            region: (float(rainfall[row].min()) if row.any() else None)
+            for region, row in zip(regions, danger)
+        }
+        result = {
+            "regions": regions,
+            "rainfall_mm": rainfall,
+            "risk_score": risk,
+            "status": np.where(danger, "DANGER", "STABLE").tolist(),
+            # Lowest swept rainfall that puts each region in DANGER
+            "danger_threshold_mm": first_danger,
+            "strategy": "Flood-Pothole Correlation (MrIridescent Engine)"
+        }
+        if include_zones:
+            result["incubation_zones"] = [
+                [self._incubation_zones(region, float(score)) for score in row]
+                for region, row in zip(regions, risk)
+            ]
+        self._store(key, result)
+        return result
+
 flood_service = FloodCorrelationService()
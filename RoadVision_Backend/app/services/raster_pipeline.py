@@ -0,0 +1,422 @@
+# app/services/raster_pipeline.py
+"""
+Tiled raster analysis for satellite scenes.
+
+Scenes are never loaded whole: GeoTIFFs are read window by window (rasterio) and NumPy
+scenes (.npy, bands x rows x cols) are memory-mapped, so only the tiles in flight are
+resident. A per-pixel degradation index is computed over the road mask with vectorized
+NumPy and reduced to per-tile statistics. Tiles run on a thread pool with a bounded
+number in flight, which caps peak memory regardless of scene size. Results are kept per
+(scene, tile) with an imagery digest, so later passes only recompute changed tiles.
+"""
+
+import hashlib
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.storage import file_version, read_json, write_json
+
+try:
+    import rasterio  # Optional: GeoTIFF windowed reads + georeferencing
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RASTER_TILE_SIZE = 512          # Tile edge in pixels
+RASTER_WORKERS = 4              # Tiles analysed in parallel
+RASTER_MAX_INFLIGHT = 8         # Tiles read but not yet reduced (bounds peak memory)
+RASTER_STATE_DIR = Path("data/satellite/passes")   # Last pass per scene (change detection)
+CHANGE_DELTA_LIMIT = 20         # Largest per-tile degradation deltas kept per pass
+RASTER_BANDS = {"red": 0, "green": 1, "blue": 2, "nir": 3}   # Band order (0-based)
+DEGRADED_PIXEL_INDEX = 30.0     # Pixel index above which a road pixel counts as degraded
+FAILURE_TILE_FRACTION = 0.25    # Degraded share of road pixels that flags a tile
+CRITICAL_TILE_FRACTION = 0.5
+MIN_ROAD_PIXELS = 64            # Tiles with fewer road pixels are skipped
+
+SCENE_SUFFIXES = (".tif", ".tiff", ".npy")
+
+
+@dataclass(frozen=True)
+class Tile:
+    row: int
+    col: int
+    y: int            # Pixel offset of the tile's top-left corner
+    x: int
+    height: int
+    width: int
+
+
+def _reflectance_scale(dtype) -> float:
+    """Divisor that maps raw band values to 0..1 reflectance"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return 1.0
+    if dtype == np.uint16:
+        return 10000.0   # Sentinel-2 L2A reflectance scaling
+    return float(np.iinfo(dtype).max)
+
+
+def degradation_index(bands: np.ndarray, scale: float) -> np.ndarray:
+    """Per-pixel road degradation index (0-100) from red/green/blue/nir bands.
+
+    Worn or broken asphalt reads brighter than intact asphalt, vegetation pushing
+    through the surface raises NDVI, and standing water raises NDWI.
+    """
+    b = bands.astype(np.float32, copy=False) / np.float32(scale)
+    red, green, blue, nir = (b[RASTER_BANDS[k]] for k in ("red", "green", "blue", "nir"))
+    eps = np.float32(1e-6)
+    brightness = (red + green + blue) / np.float32(3.0)
+    ndvi = (nir - red) / (nir + red + eps)
+    ndwi = (green - nir) / (green + nir + eps)
+    index = (
+        np.float32(0.5) * np.clip(brightness, 0, 1)
+        + np.float32(0.3) * np.clip(ndvi, 0, 1)
+        + np.float32(0.2) * np.clip(ndwi, 0, 1)
+    )
+    return index * np.float32(100.0)
+
+
+def default_road_mask(bands: np.ndarray, scale: float) -> np.ndarray:
+    """Spectral road mask used when a scene has no mask: low-vegetation, non-water pixels"""
+    b = bands.astype(np.float32, copy=False) / np.float32(scale)
+    red, green, nir = b[RASTER_BANDS["red"]], b[RASTER_BANDS["green"]], b[RASTER_BANDS["nir"]]
+    eps = np.float32(1e-6)
+    ndvi = (nir - red) / (nir + red + eps)
+    ndwi = (green - nir) / (green + nir + eps)
+    return (ndvi < 0.2) & (ndwi < 0.1)
+
+
+class RasterScene:
+    """Read-only handle on a scene: metadata plus windowed band / road-mask reads.
+
+    NumPy scenes use `<stem>_roads.npy` as the road mask and `<stem>.json`
+    ({"bounds": {"lat": [min, max], "lon": [min, max]}}) for georeferencing;
+    GeoTIFFs use `<stem>_roads.tif` and their own transform.
+    """
+
+    def __init__(self, path, bounds: Optional[Dict] = None):
+        self.path = Path(path)
+        self.version = f"{self.path.name}-{file_version(self.path)}"
+        self.kind = "npy" if self.path.suffix == ".npy" else "geotiff"
+        self._transform = None
+
+        if self.kind == "npy":
+            bands = np.load(self.path, mmap_mode="r")
+            if bands.ndim != 3:
+                raise ValueError(f"Expected a (bands, rows, cols) array in {self.path}")
+            self.count, self.height, self.width = bands.shape
+            self.dtype = bands.dtype
+            del bands
+            mask_path = self.path.with_name(f"{self.path.stem}_roads.npy")
+            self._mask_path = mask_path if mask_path.exists() else None
+            meta = read_json(self.path.with_suffix(".json"), {})
+            self.bounds = bounds or meta.get("bounds")
+        else:
+            if rasterio is None:
+                raise RuntimeError("rasterio is required for GeoTIFF scenes (pip install rasterio)")
+            with rasterio.open(self.path) as ds:
+                self.count, self.height, self.width = ds.count, ds.height, ds.width
+                self.dtype = np.dtype(ds.dtypes[0])
+                self._transform = ds.transform
+                if bounds is None and ds.crs is not None and ds.crs.is_geographic:
+                    b = ds.bounds
+                    bounds = {"lat": [b.bottom, b.top], "lon": [b.left, b.right]}
+            mask_path = self.path.with_name(f"{self.path.stem}_roads{self.path.suffix}")
+            self._mask_path = mask_path if mask_path.exists() else None
+            self.bounds = bounds
+
+        if self.count < len(RASTER_BANDS):
+            raise ValueError(f"{self.path} has {self.count} bands, {len(RASTER_BANDS)} required")
+        self.scale = _reflectance_scale(self.dtype)
+
+    def tiles(self, tile_size: int = RASTER_TILE_SIZE) -> Iterator[Tile]:
+        for row, y in enumerate(range(0, self.height, tile_size)):
+            for col, x in enumerate(range(0, self.width, tile_size)):
+                yield Tile(row, col, y, x, min(tile_size, self.height - y), min(tile_size, self.width - x))
+
+    def read(self, tile: Tile) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Read one tile's bands and road mask (only this window is materialised)"""
+        if self.kind == "npy":
+            # A short-lived mapping per tile: pages touched for this window are unmapped
+            # once it is copied out, so resident memory does not grow with the scene
+            window = (slice(tile.y, tile.y + tile.height), slice(tile.x, tile.x + tile.width))
+            bands = np.array(np.load(self.path, mmap_mode="r")[(slice(0, len(RASTER_BANDS)),) + window])
+            mask = None
+            if self._mask_path is not None:
+                mask = np.array(np.load(self._mask_path, mmap_mode="r")[window], dtype=bool)
+            return bands, mask
+
+        window = Window(tile.x, tile.y, tile.width, tile.height)
+        # Dataset handles are not thread-safe; each tile opens its own
+        with rasterio.open(self.path) as ds:
+            bands = ds.read(list(range(1, len(RASTER_BANDS) + 1)), window=window)
+        mask = None
+        if self._mask_path is not None:
+            with rasterio.open(self._mask_path) as ds:
+                mask = ds.read(1, window=window).astype(bool)
+        return bands, mask
+
+    def tile_center(self, tile: Tile) -> Optional[Dict]:
+        """Geographic centre of a tile, if the scene is georeferenced"""
+        cy, cx = tile.y + tile.height / 2, tile.x + tile.width / 2
+        if self.bounds:
+            lat_min, lat_max = self.bounds["lat"]
+            lon_min, lon_max = self.bounds["lon"]
+            return {
+                "lat": round(lat_max - (lat_max - lat_min) * cy / self.height, 6),
+                "lon": round(lon_min + (lon_max - lon_min) * cx / self.width, 6)
+            }
+        return None
+
+
+def tile_digest(bands: np.ndarray, mask: Optional[np.ndarray]) -> str:
+    """Content hash of a tile's imagery (and road mask) for change detection"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(bands).data)
+    if mask is not None:
+        h.update(np.ascontiguousarray(mask).data)
+    return h.hexdigest()
+
+
+def analyze_tile(scene: RasterScene, tile: Tile, previous: Optional[Dict] = None) -> Tuple[Dict, bool]:
+    """Degradation statistics of one tile over its road pixels.
+
+    Returns (result, reused): when `previous` (the same tile from the last pass) has
+    the same imagery digest, its result is reused and the index is not recomputed.
+    """
+    bands, mask = scene.read(tile)
+    digest = tile_digest(bands, mask)
+    if previous is not None and previous.get("digest") == digest:
+        return previous, True
+
+    if mask is None:
+        mask = default_road_mask(bands, scene.scale)
+    road_pixels = int(np.count_nonzero(mask))
+
+    result = {
+        "tile": [tile.row, tile.col],
+        "digest": digest,
+        "road_pixels": road_pixels,
+        "location": scene.tile_center(tile)
+    }
+    if road_pixels < MIN_ROAD_PIXELS:
+        result.update(mean_degradation=None, degraded_fraction=0.0)
+        return result, False
+
+    road_index = degradation_index(bands, scene.scale)[mask]
+    result.update(
+        mean_degradation=round(float(road_index.mean()), 2),
+        degraded_fraction=round(float(np.count_nonzero(road_index > DEGRADED_PIXEL_INDEX)) / road_pixels, 4)
+    )
+    return result, False
+
+
+def _tile_key(result: Dict) -> str:
+    return f"{result['tile'][0]}-{result['tile'][1]}"
+
+
+class RasterPipeline:
+    """Parallel tile analysis with a bounded in-flight window and per-tile change detection.
+
+    The last pass of every scene (tile results + imagery digests) is kept in memory and
+    persisted under `state_dir`, keyed by scene name and tile. A new pass over an
+    unchanged file reuses it outright; otherwise each tile is read and hashed, and only
+    tiles whose digest changed are recomputed.
+    """
+
+    def __init__(self, workers: int = RASTER_WORKERS, max_inflight: int = RASTER_MAX_INFLIGHT,
+                 state_dir: Optional[Path] = RASTER_STATE_DIR):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="raster")
+        self.max_inflight = max(max_inflight, workers)
+        self.state_dir = Path(state_dir) if state_dir is not None else None
+        self._passes: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _pass_file(self, name: str) -> Optional[Path]:
+        return self.state_dir / f"{name}.json" if self.state_dir is not None else None
+
+    def previous_pass(self, name: str) -> Optional[Dict]:
+        """Last recorded pass of a scene (loaded from disk on first use)"""
+        with self._lock:
+            if name not in self._passes:
+                pass_file = self._pass_file(name)
+                self._passes[name] = read_json(pass_file) if pass_file is not None else None
+            return self._passes[name]
+
+    def _record_pass(self, name: str, record: Dict):
+        with self._lock:
+            self._passes[name] = record
+        pass_file = self._pass_file(name)
+        if pass_file is not None:
+            try:
+                pass_file.parent.mkdir(parents=True, exist_ok=True)
+                write_json(pass_file, record)
+            except Exception as e:
+                logger.error(f"Could not persist raster pass for {name}: {e}")
+
+    def analyze_tiles(self, scene: RasterScene, tile_size: int = RASTER_TILE_SIZE,
+                      previous: Optional[Dict] = None) -> Tuple[List[Dict], int]:
+        """Analyse every tile of a scene; at most max_inflight tiles are resident at once.
+
+        `previous` maps tile keys to the last pass's results. Returns (results, reused).
+        """
+        previous = previous or {}
+        results: List[Dict] = []
+        reused = 0
+        pending = set()
+
+        def collect(done):
+            nonlocal reused
+            for future in done:
+                pending.discard(future)
+                result, was_reused = future.result()
+                results.append(result)
+                reused += was_reused
+
+        for tile in scene.tiles(tile_size):
+            if len(pending) >= self.max_inflight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(self.executor.submit(analyze_tile, scene, tile, previous.get(f"{tile.row}-{tile.col}")))
+        collect(list(pending))
+
+        results.sort(key=lambda r: tuple(r["tile"]))
+        return results, reused
+
+    def analyze_scene(self, path, bounds: Optional[Dict] = None, tile_size: int = RASTER_TILE_SIZE,
+                      change_detection: bool = True) -> Dict:
+        """Scene-level degradation report: per-tile statistics, flagged failure tiles and,
+        when the scene was analysed before, degradation deltas against that pass.
+
+        With change_detection off every tile is recomputed (deltas are still reported).
+        """
+        scene = RasterScene(path, bounds=bounds)
+        name = scene.path.stem
+        last = self.previous_pass(name)
+        comparable = (
+            last is not None and last.get("tile_size") == tile_size and last.get("bounds") == scene.bounds
+        )
+        previous_tiles = last["tiles"] if comparable else {}
+
+        if change_detection and comparable and last.get("version") == scene.version:
+            # Same file as the last pass: nothing to read
+            tiles, reused = list(previous_tiles.values()), len(previous_tiles)
+        else:
+            tiles, reused = self.analyze_tiles(scene, tile_size, previous_tiles if change_detection else None)
+        logger.info(f"Raster scene {scene.path.name}: {len(tiles)} tiles ({reused} unchanged, reused)")
+
+        scored = [t for t in tiles if t["mean_degradation"] is not None]
+        road_pixels = sum(t["road_pixels"] for t in scored)
+        mean_degradation = round(
+            sum(t["mean_degradation"] * t["road_pixels"] for t in scored) / road_pixels if road_pixels else 0.0, 2
+        )
+        failures = [
+            {
+                **t,
+                "severity": "CRITICAL" if t["degraded_fraction"] >= CRITICAL_TILE_FRACTION else "MEDIUM"
+            }
+            for t in scored if t["degraded_fraction"] >= FAILURE_TILE_FRACTION
+        ]
+
+        changes = None
+        if comparable:
+            deltas = []
+            for t in scored:
+                before = previous_tiles.get(_tile_key(t))
+                if before is None or before is t or before.get("mean_degradation") is None:
+                    continue
+                delta = round(t["mean_degradation"] - before["mean_degradation"], 2)
+                if delta:
+                    deltas.append({
+                        "tile": t["tile"],
+                        "location": t["location"],
+                        "previous": before["mean_degradation"],
+                        "current": t["mean_degradation"],
+                        "delta": delta
+                    })
+            deltas.sort(key=lambda d: -abs(d["delta"]))
+            changes = {
+                "previous_version": last.get("version"),
+                "tiles_changed": len(tiles) - reused,
+                "tiles_unchanged": reused,
+                "mean_degradation_delta": round(mean_degradation - last.get("mean_degradation", 0.0), 2),
+                "tile_deltas": deltas[:CHANGE_DELTA_LIMIT]
+            }
+
+        self._record_pass(name, {
+            "version": scene.version,
+            "tile_size": tile_size,
+            "bounds": scene.bounds,
+            "mean_degradation": mean_degradation,
+            "tiles": {_tile_key(t): t for t in tiles}
+        })
+
+        return {
+            "scene": scene.path.name,
+            "scene_version": scene.version,
+            "size": [scene.height, scene.width],
+            "tile_size": tile_size,
+            "tiles_analyzed": len(tiles),
+            "tiles_reused": reused,
+            "road_pixels": road_pixels,
+            "mean_degradation": mean_degradation,
+            "failures": failures,
+            "changes": changes,
+            "tiles": tiles
+        }
+
+
+def find_scene(scene_dir: Path, name: str) -> Optional[Path]:
+    """Locate a region's scene file (`<name>.tif`, `.tiff` or `.npy`)"""
+    for suffix in SCENE_SUFFIXES:
+        candidate = Path(scene_dir) / f"{name}{suffix}"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def make_synthetic_scene(path, height: int, width: int, seed: int = 0, bounds: Optional[Dict] = None,
+                         chunk_rows: int = RASTER_TILE_SIZE) -> Path:
+    """Write a synthetic uint16 4-band scene (+ road mask and metadata) for local testing.
+
+    Written in row chunks through memory-mapped output, so arbitrarily large scenes can
+    be generated without holding them in memory.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    bands = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint16, shape=(len(RASTER_BANDS), height, width))
+    roads = np.lib.format.open_memmap(
+        path.with_name(f"{path.stem}_roads.npy"), mode="w+", dtype=np.uint8, shape=(height, width)
+    )
+    # A regular street grid with a few worn patches
+    spacing = max(16, min(height, width) // 20)
+    worn_blocks = rng.random((height // spacing + 1, width // spacing + 1)) < 0.15
+    cols = np.arange(width)
+    for y in range(0, height, chunk_rows):
+        rows = np.arange(y, min(y + chunk_rows, height))
+        grid = (rows[:, None] % spacing < 4) | (cols[None, :] % spacing < 4)
+        noise = rng.normal(0, 150, size=(len(RASTER_BANDS), len(rows), width))
+        base = np.where(grid, 1200, 900)[None].astype(np.float32) + noise
+        worn = grid & worn_blocks[rows // spacing][:, cols // spacing]
+        base[:3, worn] += 6000
+        bands[:, rows[0]:rows[-1] + 1] = np.clip(base, 0, 10000).astype(np.uint16)
+        roads[rows[0]:rows[-1] + 1] = grid
+    bands.flush()
+    roads.flush()
+    del bands, roads
+
+    write_json(path.with_suffix(".json"), {"bounds": bounds or {"lat": [6.40, 6.70], "lon": [3.10, 3.60]}})
+    return path
+
+
+raster_pipeline = RasterPipeline()
@@ -0,0 +1,309 @@
+# app/services/repair_verification.py
+"""
+Batch AI verification of contractor repairs.
+
+A submission names the original detection (video + pothole track) and carries an
+"after" photo of the repaired spot; the "before" image is either uploaded too or cut
+from the original video at the track's best frame. Jobs are queued and a single worker
+drains the queue in batches, running the detector over every before/after image of a
+batch in one predict call on a dedicated thread, so a month-end rush queues up instead
+of blocking the API. Each job compares the pothole area the detector still finds inside
+the original bbox (plus a margin) with the area it finds there in the before image.
+Uploaded photos are deleted once their batch has run; the verdict is what gets kept.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+
+from app.core.model_loader import load_yolo_model
+from app.core.storage import save_stream
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DETECTOR_WEIGHTS = "models/best.pt"
+VERIFY_BATCH_SIZE = 16          # Jobs per detector batch (2 images each)
+VERIFY_QUEUE_SIZE = 2000        # Queued jobs before submissions are refused
+VERIFY_JOB_HISTORY = 10000      # Finished jobs kept for polling
+VERIFY_CONFIDENCE = 0.25        # Low on purpose: a faint leftover pothole should still count
+VERIFY_IMAGE_SIZE = 640
+ASPECT_TOLERANCE = 0.05         # Uploaded before photo must match the video's aspect ratio this closely
+BBOX_MARGIN = 0.25              # Region checked = original bbox grown by this fraction per side
+REPAIRED_MAX_RATIO = 0.15       # After/before detected area at or below this: VERIFIED
+PARTIAL_MAX_RATIO = 0.5         # ... at or below this: PARTIAL, above: REJECTED
+VERIFY_IMAGE_DIR = Path("data/audit/images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+TERMINAL_JOB_STATUSES = ("completed", "error")
+
+
+def expand_bbox(bbox: Dict, margin: float, width: int, height: int) -> tuple:
+    """Grow a {x1, y1, x2, y2} box by margin per side, clipped to the image"""
+    w, h = bbox["x2"] - bbox["x1"], bbox["y2"] - bbox["y1"]
+    return (
+        max(0, int(bbox["x1"] - margin * w)), max(0, int(bbox["y1"] - margin * h)),
+        min(width, int(bbox["x2"] + margin * w)), min(height, int(bbox["y2"] + margin * h))
+    )
+
+
+def detected_area(boxes: np.ndarray, region: tuple) -> float:
+    """Pixels of the region covered by detections (overlaps rasterised, not double counted)"""
+    x1, y1, x2, y2 = region
+    if not len(boxes) or x2 <= x1 or y2 <= y1:
+        return 0.0
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    clipped = np.clip(boxes, [x1, y1, x1, y1], [x2, y2, x2, y2]).astype(int) - [x1, y1, x1, y1]
+    for bx1, by1, bx2, by2 in clipped:
+        mask[by1:by2, bx1:bx2] = True
+    return float(mask.sum())
+
+
+def scale_bbox(bbox: Dict, sx: float, sy: float) -> Dict:
+    return {"x1": bbox["x1"] * sx, "x2": bbox["x2"] * sx, "y1": bbox["y1"] * sy, "y2": bbox["y2"] * sy}
+
+
+def region_area(region: tuple) -> int:
+    return max(1, (region[2] - region[0]) * (region[3] - region[1]))
+
+
+def save_image(upload) -> Path:
+    """Store an uploaded before/after photo (under a generated name) for the verifier thread"""
+    suffix = Path(upload.filename or "").suffix.lower()
+    if suffix not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid image type. Please upload a JPEG or PNG.")
+    VERIFY_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    path = VERIFY_IMAGE_DIR / f"{uuid.uuid4().hex}{suffix}"
+    save_stream(path, upload.file)
+    return path
+
+
+def discard_images(paths: List[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def read_video_frame(video_path: str, frame_id: int) -> Optional[np.ndarray]:
+    """Frame frame_id (1-based, as numbered by the video processor)"""
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, frame_id - 1))
+        ok, frame = cap.read()
+        return frame if ok else None
+    finally:
+        cap.release()
+
+
+class RepairVerifier:
+    """Queue + batching worker around one shared detector instance.
+
+    The detector is loaded on first use and only ever called from the single verifier
+    thread (the video processor's instance carries tracker state and is not shared).
+    """
+
+    def __init__(self, batch_size: int = VERIFY_BATCH_SIZE, queue_size: int = VERIFY_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.listeners: List[Callable[[Dict], object]] = []
+        self.batches_run = 0
+        self._model = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="repair-verifier")
+
+    # --- Queue -------------------------------------------------------------------
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def submit(self, request: Dict) -> Dict:
+        """Queue a verification; request carries contractor/pothole ids, bbox, image sources"""
+        self.start()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "status": "queued",
+            "submitted_at": datetime.now().isoformat(),
+            **{k: request[k] for k in ("contractor_id", "pothole_id", "video_id")}
+        }
+        try:
+            self._queue.put_nowait((job, request))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Verification queue is full, retry later")
+        self.jobs[job["job_id"]] = job
+        self._trim_history()
+        return dict(job)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        if job["status"] == "queued":
+            job["queue_depth"] = self._queue.qsize()
+        return job
+
+    def _trim_history(self):
+        excess = len(self.jobs) - VERIFY_JOB_HISTORY
+        for job_id in list(self.jobs)[:max(0, excess)]:
+            if self.jobs[job_id]["status"] in TERMINAL_JOB_STATUSES:
+                del self.jobs[job_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Whatever piled up while the last batch ran forms the next batch
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for job, _ in batch:
+                job["status"] = "processing"
+            try:
+                await loop.run_in_executor(self._executor, self._verify_batch, batch)
+            except Exception as e:
+                logger.error(f"Repair verification batch failed: {e}")
+                for job, _ in batch:
+                    job.update(status="error", error=str(e))
+            self.batches_run += 1
+            # Notify for the whole batch at once so e.g. ledger writes share one fsync
+            await asyncio.gather(*(self._notify(job) for job, _ in batch))
+
+    async def _notify(self, job: Dict):
+        for listener in self.listeners:
+            try:
+                result = listener(dict(job))
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Repair verification listener failed: {e}")
+
+    # --- Verification (verifier thread) -------------------------------------------
+
+    def _detector(self):
+        if self._model is None:
+            self._model = load_yolo_model(DETECTOR_WEIGHTS)
+        return self._model
+
+    @staticmethod
+    def _load_images(request: Dict):
+        after = cv2.imread(str(request["after_image"]))
+        if after is None:
+            raise ValueError("After image could not be read")
+        if request.get("before_image"):
+            before = cv2.imread(str(request["before_image"]))
+        else:
+            before = read_video_frame(request["video_path"], request["frame_id"])
+        if before is None:
+            raise ValueError("Before image could not be read")
+        return before, after
+
+    def _verify_batch(self, batch: List):
+        try:
+            self._detect_batch(batch)
+        finally:
+            discard_images([
+                path for _, request in batch
+                for path in (request.get("after_image"), request.get("before_image")) if path
+            ])
+
+    def _prepare(self, request: Dict):
+        """Before/after images and the check regions on each; ValueError if unusable"""
+        before, after = self._load_images(request)
+        # The original bbox is in video-frame pixels; map it onto both photos
+        bh, bw = before.shape[:2]
+        ah, aw = after.shape[:2]
+        fw, fh = request.get("frame_size") or (bw, bh)
+        if abs((bw / bh) / (fw / fh) - 1) > ASPECT_TOLERANCE:
+            raise ValueError(f"Before image is {bw}x{bh}; expected the video's {fw}x{fh} framing")
+        bbox = scale_bbox(request["bbox"], bw / fw, bh / fh)
+        scaled = scale_bbox(bbox, aw / bw, ah / bh)
+        return (before, after), (expand_bbox(bbox, BBOX_MARGIN, bw, bh), expand_bbox(scaled, BBOX_MARGIN, aw, ah))
+
+    def _detect_batch(self, batch: List):
+        images, regions, ready = [], [], []
+        for job, request in batch:
+            # One bad job (unreadable photo, bad geometry) must not fail the rest of the batch
+            try:
+                pair, pair_regions = self._prepare(request)
+            except Exception as e:
+                job.update(status="error", error=str(e) or type(e).__name__)
+                continue
+            images += pair
+            regions += pair_regions
+            ready.append(job)
+        if not ready:
+            return
+
+        results = self._detector().predict(
+            images, conf=VERIFY_CONFIDENCE, imgsz=VERIFY_IMAGE_SIZE, verbose=False
+        )
+        areas = [
+            detected_area(r.boxes.xyxy.cpu().numpy(), region) for r, region in zip(results, regions)
+        ]
+        for i, job in enumerate(ready):
+            # Compare coverage fractions so differing before/after resolutions do not matter
+            before_cover = areas[2 * i] / region_area(regions[2 * i])
+            after_cover = areas[2 * i + 1] / region_area(regions[2 * i + 1])
+            job.update(
+                status="completed",
+                completed_at=datetime.now().isoformat(),
+                result=self._judge(before_cover, after_cover)
+            )
+
+    @staticmethod
+    def _judge(before_cover: float, after_cover: float) -> Dict:
+        if before_cover == 0:
+            return {
+                "verification_status": "INCONCLUSIVE",
+                "maintenance_quality": None,
+                "reason": "No pothole detected at the original location in the before image",
+                "before_coverage": 0.0,
+                "after_coverage": round(after_cover, 4)
+            }
+        ratio = after_cover / before_cover
+        if ratio <= REPAIRED_MAX_RATIO:
+            status = "VERIFIED"
+        elif ratio <= PARTIAL_MAX_RATIO:
+            status = "PARTIAL"
+        else:
+            status = "REJECTED"
+        return {
+            "verification_status": status,
+            "maintenance_quality": int(round(100 * (1 - min(ratio, 1.0)))),
+            "before_coverage": round(before_cover, 4),
+            "after_coverage": round(after_cover, 4),
+            "remaining_ratio": round(ratio, 4)
+        }
+
+    def summary(self) -> Dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches_run": self.batches_run,
+            "jobs": counts
+        }
+
+
+repair_verifier = RepairVerifier()
@@ -1,14 +1,54 @@
+import math
 import random
 import asyncio
+import time
 from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# Configuration
+PROVIDER_LATENCY = 1.5          # Simulated Google Earth / Sentinel-2 API latency (seconds)
+SCAN_CONCURRENCY = 32           # Provider requests in flight at once
+PROVIDER_RATE_LIMIT = 50.0      # Provider requests per second (token bucket)
+GRID_CELL_DEG = 0.05            # Default grid cell size in degrees (~5.5 km)
+GRID_MAX_CELLS = 5000           # Upper bound on cells per grid scan
+CELL_CACHE_TTL = 900.0          # Seconds a cell scan result is reused
+
+Cell = Tuple[float, float]
+
+
+class RateLimiter:
+    """Async token bucket: at most `rate` acquisitions per second, bursting to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 
 class LagosSatelliteSentinel:
     """
     ROADvision_Lagos: Satellite Macro-Analysis Engine
     Scans geographical coordinates in Lagos to identify road degradation from space.
+
+    Provider calls are bounded by a semaphore (SCAN_CONCURRENCY) and a rate limiter, so
+    a grid of N cells completes in roughly N / concurrency x latency. Cell results are
+    cached for CELL_CACHE_TTL and concurrent requests for the same cell share one call.
     """
-    
-    def __init__(self):
+
+    def __init__(self, concurrency: int = SCAN_CONCURRENCY, rate_limit: float = PROVIDER_RATE_LIMIT):
         self.lagos_bounds = {
             "lat": (6.40, 6.70),
             "lon": (3.10, 3.60)
@@ -17,17 +57,24 @@ class LagosSatelliteSentinel:
             "Third Mainland Bridge", "Ikorodu Road", "Oshodi-Apapa Expressway",
             "Lekki-Epe Expressway", "Badagry Expressway", "Agege Motor Road"
         ]
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._rate_limiter = RateLimiter(rate_limit)
+        self._cell_cache: Dict[Cell, Tuple[float, Dict]] = {}
+        self._inflight: Dict[Cell, asyncio.Future] = {}
+        self._waiters: Dict[Cell, int] = {}
 
     async def scan_coordinate(self, lat: float, lon: float):
         """Simulates real-time satellite scan of a specific coordinate"""
-        # Simulated Google Earth / Sentinel-2 API Latency
-        await asyncio.sleep(1.5)
-        
+        async with self._semaphore:
+            await self._rate_limiter.acquire()
+            # Simulated Google Earth / Sentinel-2 API Latency
+            await asyncio.sleep(PROVIDER_LATENCY)
+
         degradation_index = random.uniform(0, 100)
         traffic_congestion_factor = random.uniform(0, 1.0)
-        
+
         is_hazard = degradation_index > 65
-        
+
         return {
             "timestamp": datetime.now().isoformat(),
             "location": {"lat": lat, "lon": lon},
@@ -38,15 +85,84 @@ class LagosSatelliteSentinel:
             "creator_stamp": "David Akpoviroro Oke (MrIridescent)"
         }
 
+    def grid_cells(self, cell_deg: float = GRID_CELL_DEG) -> List[Cell]:
+        """Tile the Lagos bounds into cells, returned as cell-centre coordinates"""
+        lat_min, lat_max = self.lagos_bounds["lat"]
+        lon_min, lon_max = self.lagos_bounds["lon"]
+        # Round up so a partial strip at the north/east edge still gets a cell
+        # (the epsilon keeps an exact fit like 0.3 / 0.01 from adding an empty one)
+        rows = max(1, math.ceil((lat_max - lat_min) / cell_deg - 1e-9))
+        cols = max(1, math.ceil((lon_max - lon_min) / cell_deg - 1e-9))
+        if rows * cols > GRID_MAX_CELLS:
+            raise ValueError(f"Grid of {rows * cols} cells exceeds the {GRID_MAX_CELLS} cell limit")
+        return [
+            (round(lat_min + (r + 0.5) * cell_deg, 6), round(lon_min + (c + 0.5) * cell_deg, 6))
+            for r in range(rows) for c in range(cols)
+        ]
+
+    async def scan_cell(self, cell: Cell) -> Dict:
+        """Scan one grid cell, served from the TTL cache when fresh.
+
+        Concurrent requests for the same cell share one provider call, which is
+        cancelled only once every waiter has gone away.
+        """
+        cached = self._cell_cache.get(cell)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        task = self._inflight.get(cell)
+        if task is None:
+            task = asyncio.ensure_future(self.scan_coordinate(*cell))
+            task.add_done_callback(lambda t, c=cell: self._on_cell_scanned(c, t))
+            self._inflight[cell] = task
+        self._waiters[cell] = self._waiters.get(cell, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[cell] -= 1
+            if not self._waiters[cell]:
+                del self._waiters[cell]
+                if not task.done():
+                    task.cancel()
+
+    def _on_cell_scanned(self, cell: Cell, task: asyncio.Future):
+        self._inflight.pop(cell, None)
+        if not task.cancelled() and task.exception() is None:
+            self._cell_cache[cell] = (time.monotonic() + CELL_CACHE_TTL, task.result())
+
+    def prune_cache(self):
+        """Drop expired cell results"""
+        now = time.monotonic()
+        for cell in [c for c, (expires, _) in self._cell_cache.items() if expires <= now]:
+            del self._cell_cache[cell]
+
+    async def scan_grid(self, cell_deg: float = GRID_CELL_DEG) -> AsyncIterator[Dict]:
+        """Scan the whole city grid concurrently, yielding each cell as it finishes"""
+        self.prune_cache()
+        cells = self.grid_cells(cell_deg)
+        tasks = [asyncio.ensure_future(self._scan_grid_cell(i, cell)) for i, cell in enumerate(cells)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer stopped early (e.g. client disconnected): stop queued cells
+            for task in tasks:
+                task.cancel()
+
+    async def _scan_grid_cell(self, index: int, cell: Cell) -> Dict:
+        scan = dict(await self.scan_cell(cell))
+        scan["cell_index"] = index
+        return scan
+
     async def get_lagos_heat_map(self):
         """Generates a macro-view of road health across Lagos"""
-        results = []
-        for area in self.hotspots:
+        async def scan_area(area):
             lat = random.uniform(*self.lagos_bounds["lat"])
             lon = random.uniform(*self.lagos_bounds["lon"])
             scan = await self.scan_coordinate(lat, lon)
             scan["area_name"] = area
-            results.append(scan)
-        return results
+            return scan
+
+        return list(await asyncio.gather(*(scan_area(area) for area in self.hotspots)))
 
 satellite_sentinel = LagosSatelliteSentinel()
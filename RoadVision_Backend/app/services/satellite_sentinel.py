@@ -5,11 +5,17 @@ Created by David Akpoviroro Oke (MrIridescent)
 Specialized in Macro-scale Infrastructure Monitoring for Lagos, Nigeria
 """
 
-import json
 import random
+import threading
+from collections import deque
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from app.core.storage import (
+    read_json, read_json_lines, append_json_lines, write_json_lines, file_version
+)
+from app.services.raster_pipeline import raster_pipeline, find_scene
 
 # Simulated Satellite Data (Google Earth / Sentinel-2 integration logic)
 LAGOS_REGIONS = [
@@ -20,19 +26,94 @@ LAGOS_REGIONS = [
     {"name": "Oshodi", "lat": 6.5540, "lon": 3.3400},
 ]
 
+# Configuration
+SCAN_HISTORY_RETENTION = 500     # Most recent scans kept in the on-disk history
+SCAN_HISTORY_COMPACT_LINES = 1000  # Append-only log is compacted back to retention past this
+
 class SatelliteSentinel:
+    """Region scans with incrementally maintained city-wide aggregates.
+
+    The latest scan per region plus running score/failure totals are updated on each
+    scan, so the city health report costs O(regions) and never re-reads the history.
+    Scans are appended to a JSON-lines log that is compacted to the most recent
+    SCAN_HISTORY_RETENTION scans (plus each region's latest) once it grows too long.
+    """
+
     def __init__(self):
         self.data_dir = Path("data/satellite")
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.scan_history_file = self.data_dir / "scan_history.json"
+        self.scan_history_file = self.data_dir / "scan_history.jsonl"
+        self.legacy_history_file = self.data_dir / "scan_history.json"
+        # Imagery per region (<region>.tif / .npy); regions without a scene are simulated
+        self.scene_dir = self.data_dir / "scenes"
+        # Scans run on the storage I/O pool; guards the aggregates and the history log
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=SCAN_HISTORY_RETENTION)
+        self._latest: Dict[str, Dict] = {}
+        self._score_sum = 0.0
+        self._failure_sum = 0
+        self._last_scan: Optional[str] = None
+        self._log_lines = 0
+        self._load()
+
+    @property
+    def version(self) -> str:
+        """Store version of the scan history (used for ETags)"""
+        return file_version(self.scan_history_file)
 
-    def scan_region(self, region_name: str) -> Dict:
+    def _load(self):
+        """Rebuild the aggregates from the history log (migrating the legacy JSON file)"""
+        try:
+            if self.scan_history_file.exists():
+                history = read_json_lines(self.scan_history_file)
+                self._log_lines = len(history)
+            else:
+                history = read_json(self.legacy_history_file, [])
+                if history:
+                    write_json_lines(self.scan_history_file, history)
+                    self._log_lines = len(history)
+            # Drop regions that can no longer be scanned (e.g. logged before names were checked)
+            known = {region: self._is_known(region) for region in {scan["region"] for scan in history}}
+            for scan in history:
+                if known[scan["region"]]:
+                    self._apply(scan)
+        except Exception as e:
+            print(f"Scan history load failed: {e}")
+
+    def _apply(self, scan: Dict):
+        """Fold one scan into the running aggregates (caller holds the lock)"""
+        previous = self._latest.get(scan["region"])
+        if previous is not None:
+            self._score_sum -= previous["infrastructure_score"]
+            self._failure_sum -= len(previous["failures_detected"])
+        self._latest[scan["region"]] = scan
+        self._score_sum += scan["infrastructure_score"]
+        self._failure_sum += len(scan["failures_detected"])
+        self._recent.append(scan)
+        if self._last_scan is None or scan["timestamp"] > self._last_scan:
+            self._last_scan = scan["timestamp"]
+
+    def scan_region(self, region_name: str, change_detection: bool = True) -> Dict:
         """
         Simulate a satellite scan of a specific Lagos region.
         In a production environment, this would call Google Earth Engine or Sentinel-2 APIs.
+
+        Regions with imagery go through the raster pipeline; with change_detection only
+        tiles whose imagery changed since the previous pass are reprocessed.
+        Only LAGOS_REGIONS and regions with a scene file can be scanned (ValueError
+        otherwise), so the per-region aggregates stay bounded.
         """
-        region = next((r for r in LAGOS_REGIONS if r["name"] == region_name), LAGOS_REGIONS[0])
-        
+        region = next((r for r in LAGOS_REGIONS if r["name"] == region_name), None)
+        scene_path = self._scene_for(region_name)
+        if region is None and scene_path is None:
+            raise ValueError(f"Unknown region '{region_name}'")
+        region = region or LAGOS_REGIONS[0]
+
+        if scene_path is not None:
+            scan_result = self._scan_scene(region_name, region, scene_path, change_detection)
+            self._save_scan(scan_result)
+            return scan_result
+
         # Nuanced Logic: Detect macro-erosion hotspots
         # We simulate finding 1-5 major road failures based on satellite pixel degradation
         num_failures = random.randint(1, 5)
@@ -54,50 +135,106 @@ class SatelliteSentinel:
             "timestamp": datetime.now().isoformat(),
             "failures_detected": failures,
             "infrastructure_score": round(random.uniform(20, 85), 2),
-            "sentinel_version": "2.0-Lagos"
+            "sentinel_version": "2.0-Lagos",
+            "source": "simulated"
         }
         
         self._save_scan(scan_result)
         return scan_result
 
+    def _scene_for(self, region_name: str) -> Optional[Path]:
+        """Scene file of a region, if any (names are plain file stems, never paths)"""
+        if Path(region_name).name != region_name or region_name.startswith("."):
+            return None
+        return find_scene(self.scene_dir, region_name)
+
+    def _is_known(self, region_name: str) -> bool:
+        return any(r["name"] == region_name for r in LAGOS_REGIONS) or self._scene_for(region_name) is not None
+
+    def _scan_scene(self, region_name: str, region: Dict, scene_path: Path, change_detection: bool) -> Dict:
+        """Macro-erosion analysis of a region's imagery through the raster tile pipeline"""
+        analysis = raster_pipeline.analyze_scene(scene_path, change_detection=change_detection)
+        now = datetime.now().isoformat()
+        failures = []
+        for tile in analysis["failures"]:
+            location = tile["location"] or {"lat": region["lat"], "lon": region["lon"]}
+            failures.append({
+                "id": f"SAT-{region_name}-{tile['tile'][0]}-{tile['tile'][1]}",
+                "lat": location["lat"],
+                "lon": location["lon"],
+                "severity": tile["severity"],
+                "type": "Road Failure / Asphalt Erosion",
+                "detected_at": now,
+                "confidence": round(min(0.99, 0.5 + tile["degraded_fraction"]), 2),
+                "degraded_fraction": tile["degraded_fraction"]
+            })
+
+        return {
+            "region": region_name,
+            "coordinates": {"lat": region["lat"], "lon": region["lon"]},
+            "timestamp": now,
+            "failures_detected": failures,
+            "infrastructure_score": round(100 - analysis["mean_degradation"], 2),
+            "sentinel_version": "2.0-Lagos",
+            "source": "raster",
+            "scene": analysis["scene"],
+            "tiles_analyzed": analysis["tiles_analyzed"],
+            "tiles_reused": analysis["tiles_reused"],
+            # Degradation deltas against the previous pass (None on the first pass)
+            "changes": analysis["changes"]
+        }
+
     def _save_scan(self, result: Dict):
-        history = []
-        if self.scan_history_file.exists():
-            with open(self.scan_history_file, "r") as f:
-                history = json.load(f)
-        
-        history.append(result)
-        # Keep last 50 scans
-        history = history[-50:]
-        
-        with open(self.scan_history_file, "w") as f:
-            json.dump(history, f, indent=2)
+        with self._lock:
+            previous = self._latest.get(result["region"])
+            if previous is not None:
+                result["infrastructure_score_delta"] = round(
+                    result["infrastructure_score"] - previous["infrastructure_score"], 2
+                )
+            self._apply(result)
+            try:
+                append_json_lines(self.scan_history_file, [result])
+                self._log_lines += 1
+                if self._log_lines > SCAN_HISTORY_COMPACT_LINES:
+                    self._compact()
+            except Exception as e:
+                print(f"Scan history write failed: {e}")
+
+    def _compact(self):
+        """Rewrite the log to the retained scans, keeping every region's latest scan
+        so the aggregates survive a restart (caller holds the lock)"""
+        recent_ids = {id(scan) for scan in self._recent}
+        older_latest = [scan for scan in self._latest.values() if id(scan) not in recent_ids]
+        older_latest.sort(key=lambda scan: scan["timestamp"])
+        records = older_latest + list(self._recent)
+        write_json_lines(self.scan_history_file, records)
+        self._log_lines = len(records)
+
+    def current_failures(self) -> List[Dict]:
+        """Failures from each region's latest scan (the live satellite hazard set)"""
+        with self._lock:
+            return [f for scan in self._latest.values() for f in scan["failures_detected"]]
 
     def get_city_wide_health(self) -> Dict:
-        """Aggregate data from all recent scans to provide a city-wide health report"""
-        if not self.scan_history_file.exists():
+        """City-wide health report from the running per-region aggregates"""
+        if not self._latest:
             # Run initial scans for all regions if history is empty
             for r in LAGOS_REGIONS:
                 self.scan_region(r["name"])
-        
-        with open(self.scan_history_file, "r") as f:
-            history = json.load(f)
-            
-        latest_scans = {r["name"]: None for r in LAGOS_REGIONS}
-        for scan in reversed(history):
-            if latest_scans[scan["region"]] is None:
-                latest_scans[scan["region"]] = scan
-        
-        all_scans = [s for s in latest_scans.values() if s]
-        avg_score = sum(s["infrastructure_score"] for s in all_scans) / len(all_scans) if all_scans else 0
-        total_failures = sum(len(s["failures_detected"]) for s in all_scans)
-        
-        return {
-            "city": "Lagos",
-            "average_infrastructure_score": round(avg_score, 2),
-            "total_macro_failures": total_failures,
-            "last_city_scan": datetime.now().isoformat(),
-            "regional_breakdown": latest_scans
-        }
+
+        with self._lock:
+            latest_scans = {r["name"]: None for r in LAGOS_REGIONS}
+            latest_scans.update(self._latest)
+            count = len(self._latest)
+            avg_score = self._score_sum / count if count else 0
+
+            return {
+                "city": "Lagos",
+                "average_infrastructure_score": round(avg_score, 2),
+                "total_macro_failures": self._failure_sum,
+                # Timestamp of the newest scan, so the report is stable for a given history version
+                "last_city_scan": self._last_scan,
+                "regional_breakdown": latest_scans
+            }
 
 satellite_sentinel = SatelliteSentinel()
@@ -0,0 +1,233 @@
+# app/services/spatial_join.py
+"""
+Spatial join of geotagged potholes with flood-risk cells and satellite failures.
+
+Every layer is held in a grid-hash index (fixed-size lat/lon buckets), so a radius query
+only measures haversine distances to points in the neighbouring buckets instead of the
+whole layer. Pothole-hazard pairs within JOIN_RADIUS_M are precomputed and refreshed
+incrementally from each source's version: new potholes appended to the global map are
+joined on their own, and a changed hazard layer only re-queries the pothole index around
+its own points.
+"""
+
+import logging
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.storage import GLOBAL_MAP_FILE, file_version, read_json
+from app.services.flood_correlation import flood_service
+from app.services.satellite_sentinel import satellite_sentinel
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOIN_RADIUS_M = 500.0           # Pairs within this distance are precomputed
+JOIN_MAX_RADIUS_M = 50000.0     # Largest radius a query may ask for (~the width of Lagos)
+JOIN_INDEX_CELL_DEG = 0.01      # Grid-hash bucket size (~1.1 km)
+JOIN_FLOOD_RAINFALL_MM = 50.0   # Default rainfall scenario for the flood layer
+JOIN_FLOOD_MIN_RISK = 70.0      # Flood cells at or above this score are hazards ("DANGER")
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEG_LAT = 111320.0
+
+HAZARD_SOURCES = ("flood", "satellite")
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres (vectorized over NumPy arrays)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Grid-hash point index with radius queries"""
+
+    def __init__(self, cell_deg: float = JOIN_INDEX_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.lats: List[float] = []
+        self.lons: List[float] = []
+        self.items: List[Dict] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, lat: float, lon: float, item: Dict) -> int:
+        idx = len(self.items)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.items.append(item)
+        self.cells[self._cell(lat, lon)].append(idx)
+        return idx
+
+    def query(self, lat: float, lon: float, radius_m: float) -> List[Tuple[int, float]]:
+        """(index, distance_m) of every point within radius_m, nearest first"""
+        dlat = radius_m / METERS_PER_DEG_LAT
+        dlon = radius_m / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # Box spans more buckets than are occupied: filter the occupied ones instead
+            keys = [(i, j) for i, j in self.cells if i0 <= i <= i1 and j0 <= j <= j1]
+        else:
+            keys = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+        candidates = [idx for key in keys for idx in self.cells.get(key, ())]
+        if not candidates:
+            return []
+        cand = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        lats = np.fromiter((self.lats[i] for i in candidates), dtype=np.float64, count=len(candidates))
+        lons = np.fromiter((self.lons[i] for i in candidates), dtype=np.float64, count=len(candidates))
+        dist = haversine_m(lat, lon, lats, lons)
+        keep = dist <= radius_m
+        order = np.argsort(dist[keep])
+        return list(zip(cand[keep][order].tolist(), dist[keep][order].tolist()))
+
+
+class SpatialJoinEngine:
+    """Potholes within X metres of a high-risk flood cell or a satellite failure"""
+
+    def __init__(self, radius_m: float = JOIN_RADIUS_M):
+        self.radius_m = radius_m
+        self._lock = threading.Lock()
+        self._hazards = {source: GridIndex() for source in HAZARD_SOURCES}
+        self._hazard_versions: Dict[str, object] = {source: None for source in HAZARD_SOURCES}
+        # source -> pothole index -> [(hazard index, distance_m)], nearest first
+        self._pairs: Dict[str, Dict[int, List[Tuple[int, float]]]] = {source: {} for source in HAZARD_SOURCES}
+        self._reset_potholes()
+
+    def _reset_potholes(self):
+        self._potholes = GridIndex()
+        self._map_version = None
+        self._map_consumed = 0      # Global map entries already indexed (geotagged or not)
+        for pairs in self._pairs.values():
+            pairs.clear()
+
+    # --- Incremental refresh ------------------------------------------------
+
+    def refresh(self, flood_rainfall_mm: float = JOIN_FLOOD_RAINFALL_MM):
+        """Bring indexes and precomputed pairs up to date with their sources (blocking)"""
+        with self._lock:
+            self._refresh_potholes()
+            self._refresh_hazards("satellite", satellite_sentinel.version, self._satellite_points)
+            self._refresh_hazards(
+                "flood", (flood_rainfall_mm, JOIN_FLOOD_MIN_RISK), lambda: self._flood_points(flood_rainfall_mm)
+            )
+
+    def _refresh_potholes(self):
+        version = file_version(GLOBAL_MAP_FILE)
+        if version == self._map_version:
+            return
+        entries = read_json(GLOBAL_MAP_FILE, {"potholes": []})["potholes"]
+        if len(entries) < self._map_consumed:
+            # The map was rewritten rather than appended to: start over
+            logger.info("Global map shrank; rebuilding pothole spatial index")
+            self._reset_potholes()
+
+        added = 0
+        for entry in entries[self._map_consumed:]:
+            if entry.get("lat") is None or entry.get("lon") is None:
+                continue
+            idx = self._potholes.add(entry["lat"], entry["lon"], entry)
+            added += 1
+            for source, hazards in self._hazards.items():
+                matches = hazards.query(entry["lat"], entry["lon"], self.radius_m)
+                if matches:
+                    self._pairs[source][idx] = matches
+        self._map_consumed = len(entries)
+        self._map_version = version
+        if added:
+            logger.info(f"Spatial join: indexed {added} new geotagged potholes")
+
+    def _refresh_hazards(self, source: str, version, load_points):
+        if version == self._hazard_versions[source]:
+            return
+        index = GridIndex()
+        for lat, lon, item in load_points():
+            index.add(lat, lon, item)
+
+        pairs: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+        for h_idx in range(len(index)):
+            for p_idx, dist in self._potholes.query(index.lats[h_idx], index.lons[h_idx], self.radius_m):
+                pairs[p_idx].append((h_idx, dist))
+        for matches in pairs.values():
+            matches.sort(key=lambda m: m[1])
+
+        self._hazards[source] = index
+        self._pairs[source] = dict(pairs)
+        self._hazard_versions[source] = version
+        logger.info(f"Spatial join: {source} layer refreshed ({len(index)} hazards)")
+
+    @staticmethod
+    def _satellite_points() -> Iterable[Tuple[float, float, Dict]]:
+        for f in satellite_sentinel.current_failures():
+            yield f["lat"], f["lon"], {"id": f["id"], "severity": f["severity"]}
+
+    @staticmethod
+    def _flood_points(rainfall_mm: float) -> Iterable[Tuple[float, float, Dict]]:
+        """High-risk flood cells as points at the cell centre"""
+        grid = flood_service.grid
+        risk = flood_service.risk_surface(rainfall_mm)["risk"]
+        for row, col in zip(*np.nonzero(risk >= JOIN_FLOOD_MIN_RISK)):
+            score = float(risk[row, col])
+            yield float(grid["lats"][row]), float(grid["lons"][col]), {
+                "id": f"FLOOD-CELL-{row}-{col}",
+                "risk_score": round(score, 2)
+            }
+
+    # --- Queries -------------------------------------------------------------
+
+    def query(self, radius_m: float = 200.0, sources: Optional[List[str]] = None,
+              flood_rainfall_mm: float = JOIN_FLOOD_RAINFALL_MM) -> Dict:
+        """Geotagged potholes within radius_m of any hazard in `sources`, nearest first.
+
+        Radii up to JOIN_RADIUS_M are answered from the precomputed pairs; larger radii
+        fall back to index queries.
+        """
+        sources = [s for s in (sources or HAZARD_SOURCES) if s in HAZARD_SOURCES]
+        self.refresh(flood_rainfall_mm)
+
+        with self._lock:
+            matched: Dict[int, List[Dict]] = defaultdict(list)
+            for source in sources:
+                hazards = self._hazards[source]
+                if radius_m <= self.radius_m:
+                    candidates = self._pairs[source].items()
+                else:
+                    candidates = (
+                        (p_idx, hazards.query(self._potholes.lats[p_idx], self._potholes.lons[p_idx], radius_m))
+                        for p_idx in range(len(self._potholes))
+                    )
+                for p_idx, pairs in candidates:
+                    for h_idx, dist in pairs:
+                        if dist > radius_m:
+                            break
+                        matched[p_idx].append({
+                            "source": source,
+                            **hazards.items[h_idx],
+                            "distance_m": round(dist, 1)
+                        })
+
+            matches = []
+            for p_idx, hazards in matched.items():
+                hazards.sort(key=lambda h: h["distance_m"])
+                matches.append({**self._potholes.items[p_idx], "hazards": hazards})
+            matches.sort(key=lambda m: m["hazards"][0]["distance_m"])
+
+            return {
+                "radius_m": radius_m,
+                "sources": sources,
+                "flood_rainfall_mm": flood_rainfall_mm,
+                "geotagged_potholes": len(self._potholes),
+                "hazard_counts": {s: len(self._hazards[s]) for s in sources},
+                "matches": matches
+            }
+
+
+spatial_join = SpatialJoinEngine()
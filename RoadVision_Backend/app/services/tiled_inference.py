@@ -0,0 +1,117 @@
+# app/services/tiled_inference.py
+# SAHI-style tiled inference for high-resolution (4K UAV) footage
+
+import logging
+import numpy as np
+import torch
+import torchvision
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_BATCH_SIZE = 8
+TILE_PROPOSAL_CONF = 0.05       # Low-res pass threshold for "something may be here"
+TILE_PROPOSAL_MARGIN = 32       # ROI pixels of context added around each proposal
+TILE_NMS_IOU = 0.5
+TILE_MIN_ROI_WIDTH = 1920       # Below this the plain 640 pass already sees enough detail
+
+
+def tile_grid(width: int, height: int, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP) -> np.ndarray:
+    """Return an (N, 4) array of x1, y1, x2, y2 windows covering the image with overlap"""
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        positions = list(range(0, length - tile, stride))
+        positions.append(length - tile)
+        return positions
+
+    return np.array([
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in starts(height)
+        for x in starts(width)
+    ], dtype=np.int32)
+
+
+class TiledDetector:
+    """Tiled detection + ByteTrack for one video.
+
+    A cheap low-resolution pass over the whole ROI proposes candidate regions with a very
+    low confidence threshold. Only the overlapping full-resolution tiles that touch a
+    proposal are batched through the model, then merged with cross-tile NMS and fed to a
+    per-video ByteTrack instance so track IDs behave exactly like `model.track`.
+    """
+
+    def __init__(self, tracker_cfg: str, frame_rate: int = 30):
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_cfg)))
+        self.tracker = BYTETracker(args=cfg, frame_rate=frame_rate)
+        self.grid = None
+        self.grid_shape = None
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+
+    def _tiles_for(self, roi) -> np.ndarray:
+        h, w = roi.shape[:2]
+        if self.grid_shape != (h, w):
+            self.grid = tile_grid(w, h)
+            self.grid_shape = (h, w)
+        return self.grid
+
+    @staticmethod
+    def _select_tiles(tiles: np.ndarray, proposals: np.ndarray) -> np.ndarray:
+        """Keep tiles that intersect at least one (margin-expanded) proposal box"""
+        if len(proposals) == 0:
+            return tiles[:0]
+        m = TILE_PROPOSAL_MARGIN
+        px1, py1, px2, py2 = (proposals[:, i][None, :] for i in range(4))
+        hit = (
+            (tiles[:, 0:1] < px2 + m) & (tiles[:, 2:3] > px1 - m) &
+            (tiles[:, 1:2] < py2 + m) & (tiles[:, 3:4] > py1 - m)
+        )
+        return tiles[hit.any(axis=1)]
+
+    def detect(self, model, roi, conf: float, device: str) -> torch.Tensor:
+        """Return merged (N, 6) detections [x1, y1, x2, y2, conf, cls] in ROI coordinates"""
+        coarse = model.predict(
+            roi, conf=TILE_PROPOSAL_CONF, imgsz=TILE_SIZE, verbose=False, device=device
+        )[0].boxes.data.cpu()
+
+        tiles = self._tiles_for(roi)
+        selected = self._select_tiles(tiles, coarse[:, :4].numpy())
+        self.tiles_run += len(selected)
+        self.tiles_skipped += len(tiles) - len(selected)
+
+        # Large potholes spanning several tiles are already well resolved by the coarse pass
+        merged = [coarse[coarse[:, 4] >= conf]]
+        for start in range(0, len(selected), TILE_BATCH_SIZE):
+            batch = selected[start:start + TILE_BATCH_SIZE]
+            crops = [roi[y1:y2, x1:x2] for x1, y1, x2, y2 in batch]
+            results = model.predict(crops, conf=conf, imgsz=TILE_SIZE, verbose=False, device=device)
+            for (x1, y1, _, _), r in zip(batch, results):
+                data = r.boxes.data.cpu().clone()
+                data[:, [0, 2]] += float(x1)
+                data[:, [1, 3]] += float(y1)
+                merged.append(data)
+
+        dets = torch.cat(merged) if merged else torch.zeros((0, 6))
+        if len(dets) == 0:
+            return dets
+        keep = torchvision.ops.nms(dets[:, :4], dets[:, 4], TILE_NMS_IOU)
+        return dets[keep]
+
+    def track(self, model, roi, conf: float, device: str):
+        """Detect on tiles and update the tracker; returns (boxes, ids, confs) numpy arrays"""
+        dets = self.detect(model, roi, conf, device)
+        tracks = self.tracker.update(Boxes(dets, roi.shape[:2]).numpy(), roi)
+        if len(tracks) == 0:
+            empty = np.zeros((0,))
+            return np.zeros((0, 4)), empty, empty
+        tracks = np.asarray(tracks)
+        return tracks[:, :4], tracks[:, 4], tracks[:, 5]
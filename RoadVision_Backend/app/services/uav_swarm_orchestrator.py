@@ -1,13 +1,55 @@
-import random
+import logging
+import threading
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from app.services.coverage_planner import CoveragePlanner
+from app.services.uav_telemetry import (
+    AlertBook, ISSUE_TYPES, TELEMETRY_MAX_FUTURE_S, TELEMETRY_STALE_S, TrackBuffer
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SWARM_TICK_HZ = 10.0            # Simulation steps per second (background thread)
+UAV_SPEED_MPS = 30.0            # Cruise speed in transit / returning to base
+UAV_PATROL_MPS = 5.0            # Random-walk speed while scanning inside an LGA
+BATTERY_DRAIN_PER_S = (0.005, 0.015)  # % per second while airborne (per-drone rate)
+BATTERY_CHARGE_PER_S = 1.0      # % per second while charging at base
+BATTERY_RETURN_LEVEL = 10.0     # Reserve left on landing: drones turn back at reserve + flight home
+BATTERY_LAUNCH_LEVEL = 95.0     # Charged drones relaunch at this level
+COVERAGE_STRATEGY = "optimal"   # "optimal" (min-cost assignment) or "random" (original behaviour)
+METERS_PER_DEG = 111320.0
+
+BASE_COORDINATES = (6.5244, 3.3792)  # Base Lagos coordinates
+
+# Status codes of the struct-of-arrays state
+SCANNING, RETURNING, CHARGING, TRANSIT, HOLDING = 0, 1, 2, 3, 4
+STATUS_NAMES = ("Scanning", "Returning to Base", "Charging", "In Transit", "Holding")
+
 
 class UAVSwarmOrchestrator:
     """
     Coordinates a swarm of AI-powered UAVs to map and monitor Lagos roads in real-time.
     Targets all 20 LGAs (Local Government Areas) of Lagos.
+
+    Swarm state is a set of NumPy arrays (struct of arrays: position, target, battery,
+    status, assigned LGA and coverage cell) advanced by a fixed-rate background tick in
+    vectorized steps. Each tick publishes an immutable summary snapshot; read endpoints
+    only ever see a snapshot and never mutate the simulation.
+
+    Tasks come from the CoveragePlanner: drones charged at base or holding after
+    finishing a cell are replanned each tick; mapping progress is the covered share of
+    each LGA's cells.
+
+    Drones that report telemetry (ingest_telemetry) are "live": their reported position,
+    battery and status overwrite the arrays and the simulation leaves them alone until
+    they have been silent for TELEMETRY_STALE_S. Silence is measured on the server clock
+    (when a batch arrived), so a drone with a skewed clock still goes stale on time.
     """
-    
+
     LGAS = [
         "Agege", "Ajeromi-Ifelodun", "Alimosho", "Amuwo-Odofin", "Apapa",
         "Badagry", "Epe", "Eti-Osa", "Ibeju-Lekki", "Ifako-Ijaiye",
@@ -15,55 +57,332 @@ class UAVSwarmOrchestrator:
         "Mushin", "Ojo", "Oshodi-Isolo", "Shomolu", "Surulere"
     ]
 
-    def __init__(self, swarm_size: int = 50):
+    # Approximate LGA centroids (lat, lon), in LGAS order
+    LGA_CENTROIDS = np.array([
+        (6.6180, 3.3209), (6.4550, 3.3340), (6.6110, 3.2580), (6.4630, 3.2850), (6.4490, 3.3590),
+        (6.4150, 2.8810), (6.5840, 3.9830), (6.4590, 3.6010), (6.4700, 3.8800), (6.6600, 3.3200),
+        (6.6020, 3.3510), (6.6190, 3.5110), (6.5730, 3.3920), (6.4540, 3.3950), (6.4970, 3.3790),
+        (6.5330, 3.3500), (6.4600, 3.1700), (6.5350, 3.3140), (6.5390, 3.3840), (6.5000, 3.3540)
+    ])
+
+    def __init__(self, swarm_size: int = 50, tick_hz: float = SWARM_TICK_HZ, seed: int = None,
+                 assignment: str = COVERAGE_STRATEGY):
         self.swarm_size = swarm_size
-        self.uav_status = self._initialize_swarm()
-        self.mapping_progress = {lga: 0.0 for lga in self.LGAS}
-
-    def _initialize_swarm(self) -> List[Dict]:
-        return [
-            {
-                "id": f"UAV-{i:03d}",
-                "battery": 100,
-                "lga": random.choice(self.LGAS),
-                "status": "Scanning",
-                "coordinates": (6.5244, 3.3792)  # Base Lagos coordinates
-            }
-            for i in range(self.swarm_size)
-        ]
-
-    def update_swarm_status(self):
-        """Simulates real-time swarm movement and mapping progress across Lagos."""
-        for uav in self.uav_status:
-            # Update battery and move logic
-            uav["battery"] -= random.uniform(0.1, 0.5)
-            if uav["battery"] < 20:
-                uav["status"] = "Returning to Base"
-            
-            # Simulate mapping progress in its current LGA
-            lga = uav["lga"]
-            self.mapping_progress[lga] = min(100.0, self.mapping_progress[lga] + random.uniform(0.01, 0.05))
+        self.tick_hz = tick_hz
+        self.rng = np.random.default_rng(seed)
+        self.planner = CoveragePlanner(
+            self.LGA_CENTROIDS, BASE_COORDINATES, UAV_SPEED_MPS, BATTERY_RETURN_LEVEL,
+            strategy=assignment, rng=self.rng
+        )
+        self._initialize_swarm()
+        self.mapping_progress = np.zeros(len(self.LGAS))
+        self.ticks = 0
+        self.sim_time = 0.0
+        self.coverage_completed_at = None
+        self.last_tick_ms = 0.0
+        self.telemetry_records = 0
+        self.telemetry_rejected = 0
+        self.alerts = AlertBook()
+        self._lock = threading.Lock()       # Serialises ticks with other writers
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = self._build_snapshot()
+
+    def _initialize_swarm(self):
+        n = self.swarm_size
+        self.ids = [f"UAV-{i:03d}" for i in range(n)]
+        self.index = {uav_id: i for i, uav_id in enumerate(self.ids)}
+        self.lat = np.full(n, BASE_COORDINATES[0])
+        self.lon = np.full(n, BASE_COORDINATES[1])
+        self.battery = np.full(n, 100.0)
+        self.drain = self.rng.uniform(*BATTERY_DRAIN_PER_S, size=n)
+        # Random home LGA (used by the "random" strategy; reflects the current cell otherwise)
+        self.lga = self.rng.integers(0, len(self.LGAS), size=n).astype(np.int16)
+        self.cell = np.full(n, -1, dtype=np.int64)
+        # Everyone starts docked and charged; the first ticks hand out tasks
+        self.status = np.full(n, CHARGING, dtype=np.int8)
+        self.target_lat = self.lat.copy()
+        self.target_lon = self.lon.copy()
+        # Telemetry: server time of the latest report (0 = simulated), the drone's own
+        # timestamp of that reading (orders readings only) and recent positions
+        self.last_report = np.zeros(n)
+        self.last_ts = np.zeros(n)
+        self.track = TrackBuffer(n)
+
+    # --- Simulation ------------------------------------------------------------
+
+    def _fly(self, mask: np.ndarray, dt: float) -> np.ndarray:
+        """Move masked drones straight towards their targets; returns which arrived"""
+        dlat = self.target_lat[mask] - self.lat[mask]
+        dlon = self.target_lon[mask] - self.lon[mask]
+        dist = np.hypot(dlat, dlon)
+        step = UAV_SPEED_MPS * dt / METERS_PER_DEG
+        arrived = dist <= step
+        scale = np.where(arrived, 1.0, step / np.maximum(dist, 1e-12))
+        self.lat[mask] += dlat * scale
+        self.lon[mask] += dlon * scale
+        out = np.zeros_like(mask)
+        out[mask] = arrived
+        return out
+
+    def update_swarm_status(self, dt: float = None):
+        """Advance every drone by one vectorized simulation step of dt seconds."""
+        dt = dt if dt is not None else 1.0 / self.tick_hz
+        started = time.perf_counter()
+        with self._lock:
+            status = self.status
+            sim = self.last_report <= time.time() - TELEMETRY_STALE_S
+            airborne = sim & (status != CHARGING)
+            charging = sim & (status == CHARGING)
+
+            # Drones back from telemetry without a task of ours: hold for a new one
+            orphaned = sim & (self.cell < 0) & ((status == SCANNING) | (status == TRANSIT))
+            status[orphaned] = HOLDING
+
+            # Transit to the assigned cell / return to base
+            moving = sim & ((status == TRANSIT) | (status == RETURNING))
+            arrived = self._fly(moving, dt)
+            status[arrived & (status == TRANSIT)] = SCANNING
+            status[arrived & (status == RETURNING)] = CHARGING
+
+            # Scanning: bounded random walk inside the cell, crediting coverage. Live
+            # drones are credited only while actually inside the cell we assigned them;
+            # simulated ones found outside theirs (telemetry went quiet) fly back to it
+            scanning = (status == SCANNING) & (self.cell >= 0)
+            inside = self._inside_cell()
+            away = sim & scanning & ~inside
+            status[away] = TRANSIT
+            scanning &= inside
+            walk = scanning & sim
+            k = int(walk.sum())
+            if k:
+                step = UAV_PATROL_MPS * dt / METERS_PER_DEG
+                half = self.planner.cell_half_deg
+                cells = self.cell[walk]
+                c_lat, c_lon = self.planner.cell_lat[cells], self.planner.cell_lon[cells]
+                self.lat[walk] = np.clip(self.lat[walk] + self.rng.normal(0, step, k), c_lat - half, c_lat + half)
+                self.lon[walk] = np.clip(self.lon[walk] + self.rng.normal(0, step, k), c_lon - half, c_lon + half)
+            if scanning.any():
+                cells = self.cell[scanning]
+                self.planner.record_scan(cells, dt)
+
+                done = scanning.copy()
+                done[scanning] = self.planner.completed(cells)
+                self._release_cells(done)
+                status[done] = HOLDING
+
+            # Battery
+            self.battery[airborne] = np.maximum(0.0, self.battery[airborne] - self.drain[airborne] * dt)
+            self.battery[charging] = np.minimum(100.0, self.battery[charging] + BATTERY_CHARGE_PER_S * dt)
+
+            home_m = np.hypot(self.lat - BASE_COORDINATES[0], self.lon - BASE_COORDINATES[1]) * METERS_PER_DEG
+            needed = home_m / UAV_SPEED_MPS * self.drain
+            outbound = (status == SCANNING) | (status == TRANSIT) | (status == HOLDING)
+            low = sim & outbound & (self.battery <= BATTERY_RETURN_LEVEL + needed)
+            self._send_home(low)
+
+            self._plan(sim)
+
+            self.mapping_progress = self.planner.progress_by_lga()
+            if self.coverage_completed_at is None and self.planner.fully_covered:
+                self.coverage_completed_at = self.sim_time + dt
+            self.sim_time += dt
+            self.ticks += 1
+            self.last_tick_ms = (time.perf_counter() - started) * 1000
+            self._snapshot = self._build_snapshot(live=int(self.swarm_size - sim.sum()))
+
+    def _inside_cell(self) -> np.ndarray:
+        cell = np.maximum(self.cell, 0)
+        half = self.planner.cell_half_deg + 1e-9
+        return (
+            (np.abs(self.lat - self.planner.cell_lat[cell]) <= half)
+            & (np.abs(self.lon - self.planner.cell_lon[cell]) <= half)
+        )
+
+    def _release_cells(self, mask: np.ndarray):
+        self.planner.release(self.cell[mask])
+        self.cell[mask] = -1
+
+    def _send_home(self, mask: np.ndarray):
+        self._release_cells(mask)
+        self.status[mask] = RETURNING
+        self.target_lat[mask], self.target_lon[mask] = BASE_COORDINATES
+
+    def _plan(self, sim: np.ndarray):
+        """Replan simulated drones that need a task: holding in the air, or charged at base"""
+        ready = (self.status == HOLDING) | ((self.status == CHARGING) & (self.battery >= BATTERY_LAUNCH_LEVEL))
+        ready &= sim
+        idx = np.nonzero(ready)[0]
+        if not idx.size:
+            return
+        cells = self.planner.assign(
+            self.lat[idx], self.lon[idx], self.battery[idx], self.drain[idx], self.lga[idx]
+        )
+        got = cells >= 0
+        launched = idx[got]
+        self.cell[launched] = cells[got]
+        self.status[launched] = TRANSIT
+        self.target_lat[launched] = self.planner.cell_lat[cells[got]]
+        self.target_lon[launched] = self.planner.cell_lon[cells[got]]
+        if self.planner.strategy != "random":
+            self.lga[launched] = self.planner.cell_lga[cells[got]]
+
+        # Nothing left for holding drones to do (coverage complete / no reachable cell): land
+        if self.planner.fully_covered or self.planner.strategy == "random":
+            stranded = idx[~got]
+            stranded = stranded[self.status[stranded] == HOLDING]
+            if stranded.size:
+                mask = np.zeros(self.swarm_size, bool)
+                mask[stranded] = True
+                self._send_home(mask)
+
+    # --- Telemetry ---------------------------------------------------------------
+
+    def ingest_telemetry(self, records: np.ndarray) -> Dict:
+        """Write a batch of TELEMETRY_DTYPE records into the swarm state.
+
+        Every valid reading goes into the drone's track; the newest reading per drone
+        (if newer than what we hold) overwrites position, battery and status. Records
+        flagging an issue raise or refresh a critical alert. Readings stamped more than
+        TELEMETRY_MAX_FUTURE_S ahead of the server clock are rejected.
+        """
+        received = time.time()
+        uav = records["uav"].astype(np.int64)
+        ts, lat, lon = records["ts"], records["lat"], records["lon"]
+        valid = (
+            (uav < self.swarm_size) & (records["status"] < len(STATUS_NAMES))
+            & np.isfinite(ts) & np.isfinite(lat) & np.isfinite(lon)
+            & (ts <= received + TELEMETRY_MAX_FUTURE_S)
+        )
+        uav, ts, lat, lon = uav[valid], ts[valid], lat[valid], lon[valid]
+        battery, status, issue = records["battery"][valid], records["status"][valid], records["issue"][valid]
+        new_alerts = 0
+
+        with self._lock:
+            self.telemetry_records += int(valid.sum())
+            self.telemetry_rejected += int(valid.size - valid.sum())
+            if not uav.size:
+                return {"accepted": 0, "rejected": int(valid.size), "new_alerts": 0}
+            self.track.append(uav, ts, lat, lon)
+
+            # Newest reading per drone in this batch, ignoring ones older than our state
+            order = np.lexsort((ts, uav))
+            last = order[np.r_[uav[order][1:] != uav[order][:-1], True]]
+            last = last[ts[last] > self.last_ts[uav[last]]]
+            drones = uav[last]
+            self.lat[drones] = lat[last]
+            self.lon[drones] = lon[last]
+            self.battery[drones] = np.clip(battery[last], 0.0, 100.0)
+            self.status[drones] = status[last]
+            self.last_ts[drones] = ts[last]
+            self.last_report[drones] = received
+
+            # Whatever a live drone is doing, it is not working our cell unless it says so
+            off_task = np.zeros(self.swarm_size, bool)
+            off_task[drones] = (status[last] != SCANNING) & (status[last] != TRANSIT)
+            self._release_cells(off_task)
+            returning = drones[status[last] == RETURNING]
+            self.target_lat[returning], self.target_lon[returning] = BASE_COORDINATES
+
+            flagged = np.nonzero(np.isin(issue, list(ISSUE_TYPES)))[0]
+            if flagged.size:
+                lga = self._nearest_lga(lat[flagged], lon[flagged])
+                for j, l in zip(flagged, lga):
+                    alert = self.alerts.report(
+                        int(uav[j]), self.ids[uav[j]], self.LGAS[l], int(l), int(issue[j]),
+                        float(ts[j]), float(lat[j]), float(lon[j]), received
+                    )
+                    new_alerts += alert is not None
+
+        return {"accepted": int(uav.size), "rejected": int(valid.size - uav.size), "new_alerts": new_alerts}
+
+    def _nearest_lga(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        d = np.hypot(lat[:, None] - self.LGA_CENTROIDS[:, 0], lon[:, None] - self.LGA_CENTROIDS[:, 1])
+        return d.argmin(axis=1)
+
+    def get_track(self, uav_id: str) -> Optional[Dict]:
+        """Recent reported positions of one drone, oldest first (None if unknown)"""
+        i = self.index.get(uav_id)
+        if i is None:
+            return None
+        with self._lock:
+            points = self.track.recent(i)
+            last_report = float(self.last_report[i])
+        return {
+            "uav_id": uav_id,
+            "live": last_report > time.time() - TELEMETRY_STALE_S,
+            "last_report": last_report or None,
+            "points": [{"ts": t, "lat": la, "lon": lo} for t, la, lo in points.tolist()]
+        }
+
+    def _build_snapshot(self, live: int = 0) -> Dict:
+        counts = np.bincount(self.status, minlength=len(STATUS_NAMES))
+        return {
+            "sim_time": round(self.sim_time, 1),
+            "telemetry": {
+                "live_uavs": live,
+                "records": self.telemetry_records,
+                "rejected": self.telemetry_rejected
+            },
+            "status_counts": {name: int(c) for name, c in zip(STATUS_NAMES, counts)},
+            "mean_battery": round(float(self.battery.mean()), 2) if self.swarm_size else 0.0,
+            "mapping_progress": {lga: round(float(p), 3) for lga, p in zip(self.LGAS, self.mapping_progress)},
+            "coverage": {**self.planner.summary(), "completed_at": self.coverage_completed_at}
+        }
+
+    # --- Background tick -------------------------------------------------------
+
+    def start(self):
+        """Run the simulation at tick_hz on a background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="uav-swarm-tick", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        interval = 1.0 / self.tick_hz
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.update_swarm_status(interval)
+            except Exception as e:
+                logger.error(f"Swarm tick failed: {e}")
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Fell behind: drop the missed ticks rather than bursting to catch up
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    # --- Read side (snapshots only) ---------------------------------------------
 
     def get_critical_alerts(self) -> List[Dict]:
-        """Identifies road issues needing immediate intervention."""
-        alerts = []
-        for lga, progress in self.mapping_progress.items():
-            if random.random() < 0.05:  # 5% chance of finding a critical issue
-                alerts.append({
-                    "lga": lga,
-                    "issue": "Severe Pothole/Structural Failure",
-                    "severity": "CRITICAL",
-                    "timestamp": time.time(),
-                    "recommended_action": f"Deploy Road Maintenance Team to {lga} immediately."
-                })
-        return alerts
+        """Road issues needing immediate intervention, as reported by drone telemetry."""
+        with self._lock:
+            return self.alerts.active()
 
     def get_summary(self) -> Dict:
+        snapshot = self._snapshot
+        progress = snapshot["mapping_progress"]
         return {
             "total_uavs": self.swarm_size,
-            "active_uavs": sum(1 for u in self.uav_status if u["status"] == "Scanning"),
-            "total_mapping_completion": sum(self.mapping_progress.values()) / len(self.LGAS),
-            "lga_progress": self.mapping_progress
+            "active_uavs": snapshot["status_counts"]["Scanning"],
+            "total_mapping_completion": sum(progress.values()) / len(self.LGAS),
+            "lga_progress": progress,
+            "status_counts": snapshot["status_counts"],
+            "mean_battery": snapshot["mean_battery"],
+            "sim_time": snapshot["sim_time"],
+            "coverage": snapshot["coverage"],
+            "telemetry": snapshot["telemetry"],
+            "tick_hz": self.tick_hz,
+            "last_tick_ms": round(self.last_tick_ms, 3)
         }
 
 # Global orchestrator instance
@@ -0,0 +1,177 @@
+# app/services/uav_telemetry.py
+"""
+Wire format and alert bookkeeping for drone telemetry.
+
+Drones report in batches of fixed-size packed records (TELEMETRY_DTYPE, little-endian),
+either as the raw body of POST /uav/telemetry or as binary frames on the
+/ws/uav-telemetry WebSocket. A batch decodes with one np.frombuffer call and is
+written into the orchestrator's arrays in a few vectorized steps, so ingestion cost
+is per batch rather than per message.
+"""
+
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configuration
+TELEMETRY_MAX_BATCH = 50000     # Records accepted per POST body / WebSocket frame
+TELEMETRY_STALE_S = 10.0        # Drones silent for longer are driven by the simulation again
+TELEMETRY_MAX_FUTURE_S = 5.0    # Readings stamped further ahead of the server clock are rejected
+TRACK_LENGTH = 128              # Recent positions kept per drone (ring buffer)
+ALERT_TTL_S = 600.0             # A repeat of an active alert refreshes it instead of adding one
+ALERT_MAX_ACTIVE = 5000
+
+# Packed record: one position/status report, optionally flagging a road issue
+TELEMETRY_DTYPE = np.dtype([
+    ("uav", "<u4"),         # Drone index (UAV-007 -> 7)
+    ("ts", "<f8"),          # Unix time of the reading
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("battery", "<f4"),     # %
+    ("status", "u1"),       # Orchestrator status code
+    ("issue", "u1"),        # ISSUE_TYPES code, 0 = nothing to report
+])
+
+ISSUE_TYPES = {
+    1: ("Severe Pothole/Structural Failure", "Deploy Road Maintenance Team to {lga} immediately."),
+    2: ("Flooded Carriageway", "Close affected lanes in {lga} and dispatch drainage crew."),
+    3: ("Collapsed Drainage", "Dispatch drainage crew to {lga} before the next rainfall."),
+    4: ("Road Washout", "Divert traffic and deploy emergency repair team to {lga}."),
+}
+
+
+def decode_batch(payload: bytes) -> np.ndarray:
+    """Packed bytes -> structured array (a view, no per-record parsing)"""
+    if len(payload) % TELEMETRY_DTYPE.itemsize:
+        raise ValueError(
+            f"Payload of {len(payload)} bytes is not a whole number of "
+            f"{TELEMETRY_DTYPE.itemsize}-byte records"
+        )
+    records = np.frombuffer(payload, dtype=TELEMETRY_DTYPE)
+    if records.size > TELEMETRY_MAX_BATCH:
+        raise ValueError(f"Batch of {records.size} records exceeds the {TELEMETRY_MAX_BATCH} record limit")
+    return records
+
+
+def _number(item: Dict, field: str, default=None, low: float = -math.inf, high: float = math.inf) -> float:
+    value = item.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise ValueError(f"Invalid {field} {value!r} for {item.get('uav_id')}")
+    return value
+
+
+def _code(item: Dict, field: str, valid) -> int:
+    value = item.get(field, 0)
+    if isinstance(value, bool) or not isinstance(value, int) or value not in valid:
+        raise ValueError(f"Invalid {field} {value!r} for {item.get('uav_id')}")
+    return value
+
+
+def records_from_dicts(items: Sequence[Dict], index: Dict[str, int]) -> np.ndarray:
+    """JSON fallback: [{"uav_id": "UAV-007", "lat": .., "lon": .., ...}, ...]
+
+    Fields are range-checked before packing (ValueError), so nothing wraps around
+    in the fixed-width record fields.
+    """
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Expected a JSON list of telemetry objects")
+    if len(items) > TELEMETRY_MAX_BATCH:
+        raise ValueError(f"Batch of {len(items)} records exceeds the {TELEMETRY_MAX_BATCH} record limit")
+    records = np.zeros(len(items), dtype=TELEMETRY_DTYPE)
+    now = time.time()
+    for i, item in enumerate(items):
+        uav = item.get("uav_id")
+        if uav not in index:
+            raise ValueError(f"Unknown UAV '{uav}'")
+        records[i] = (
+            index[uav], _number(item, "ts", now), _number(item, "lat", low=-90, high=90),
+            _number(item, "lon", low=-180, high=180), _number(item, "battery", 100.0, 0, 100),
+            _code(item, "status", range(256)), _code(item, "issue", (0, *ISSUE_TYPES))
+        )
+    return records
+
+
+class TrackBuffer:
+    """Last TRACK_LENGTH (ts, lat, lon) readings per drone in one preallocated array"""
+
+    def __init__(self, n: int, length: int = TRACK_LENGTH):
+        self.length = length
+        self.points = np.zeros((n, length, 3))
+        self.written = np.zeros(n, dtype=np.int64)     # Total readings per drone
+
+    def append(self, uav: np.ndarray, ts: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+        """Append readings (any order, repeats allowed); each drone's go in ts order"""
+        order = np.lexsort((ts, uav))
+        uav = uav[order]
+        counts = np.bincount(uav, minlength=self.written.size)
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(uav.size) - starts[uav]
+        slot = (self.written[uav] + rank) % self.length
+        # Fancy assignment keeps the last write per slot, i.e. the newest reading
+        self.points[uav, slot] = np.column_stack((ts[order], lat[order], lon[order]))
+        self.written += counts
+
+    def recent(self, i: int) -> np.ndarray:
+        """Readings of drone i, oldest first"""
+        n = min(int(self.written[i]), self.length)
+        end = int(self.written[i]) % self.length
+        return np.roll(self.points[i], -end, axis=0)[self.length - n:]
+
+
+class AlertBook:
+    """Active critical alerts, deduplicated on (drone, LGA, issue) within ALERT_TTL_S.
+
+    Expiry runs on server receive time; the drone's own ts is only reported back.
+    """
+
+    def __init__(self, ttl: float = ALERT_TTL_S):
+        self.ttl = ttl
+        self._active: Dict[Tuple[int, int, int], Dict] = {}
+        self.version = 0
+
+    def report(self, uav: int, uav_id: str, lga: str, lga_index: int, issue: int,
+               ts: float, lat: float, lon: float, received: float) -> Optional[Dict]:
+        """Record one sighting (received = server time of the batch); returns the alert if it is new"""
+        key = (uav, lga_index, issue)
+        alert = self._active.get(key)
+        if alert is not None and alert["last_seen"] > received - self.ttl:
+            alert["last_seen"] = max(alert["last_seen"], received)
+            alert["location"] = {"lat": lat, "lon": lon}
+            alert["reports"] += 1
+            return None
+
+        issue_name, action = ISSUE_TYPES[issue]
+        self._active[key] = alert = {
+            "uav_id": uav_id,
+            "lga": lga,
+            "issue": issue_name,
+            "severity": "CRITICAL",
+            "timestamp": ts,
+            "last_seen": received,
+            "reports": 1,
+            "location": {"lat": lat, "lon": lon},
+            "recommended_action": action.format(lga=lga)
+        }
+        self.version += 1
+        if len(self._active) > ALERT_MAX_ACTIVE:
+            self.expire(time.time())
+        return alert
+
+    def expire(self, now: float):
+        cutoff = now - self.ttl
+        stale = [k for k, a in self._active.items() if a["last_seen"] <= cutoff]
+        for key in stale:
+            del self._active[key]
+        # Still over the cap: drop the oldest
+        excess = len(self._active) - ALERT_MAX_ACTIVE
+        if excess > 0:
+            for key in sorted(self._active, key=lambda k: self._active[k]["last_seen"])[:excess]:
+                del self._active[key]
+        if stale or excess > 0:
+            self.version += 1
+
+    def active(self) -> List[Dict]:
+        self.expire(time.time())
+        return sorted((dict(a) for a in self._active.values()), key=lambda a: a["last_seen"], reverse=True)
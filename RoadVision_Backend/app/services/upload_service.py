@@ -1,14 +1,14 @@
 # app/services/upload_service.py
 
 from pathlib import Path
+from typing import Dict, Optional
 from fastapi import UploadFile, HTTPException
-import shutil
 import uuid
 import asyncio
 import logging
 
 from app.services.video_processor import VideoProcessor
-from app.core.storage import processing_status
+from app.core.storage import aset_job_status, asave_stream
 from app.ws.websocket_manager import manager
 
 logger = logging.getLogger(__name__)
@@ -21,8 +21,13 @@ class UploadService:
     def __init__(self):
         self.video_processor = VideoProcessor()
 
-    async def upload_video(self, file: UploadFile, speed_kmh: int = 30):
-        """Upload video and start background processing"""
+    async def upload_video(self, file: UploadFile, speed_kmh: int = 30, compact_results: bool = False,
+                           geotag: Optional[Dict] = None):
+        """Upload video and start background processing.
+
+        geotag ({"lat", "lon"} plus optional "end_lat"/"end_lon") places detected potholes
+        on the map, interpolated along the drive when an end fix is given.
+        """
         
         # Validate file type
         if not file.filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
@@ -39,8 +44,8 @@ class UploadService:
         video_path = UPLOAD_DIR / f"{video_id}{file_extension}"
         
         try:
-            with open(video_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # A whole video: copied on the storage I/O pool, never on the event loop
+            await asave_stream(video_path, file.file)
             
             logger.info(f"Video uploaded: {video_id} - {file.filename}")
             
@@ -49,15 +54,18 @@ class UploadService:
             raise HTTPException(status_code=500, detail="Failed to save video file")
         
         # Initialize processing status
-        processing_status[video_id] = {
-            "status": "queued",
-            "progress": 0,
-            "message": "Video uploaded, waiting to process..."
-        }
+        await aset_job_status(
+            video_id,
+            status="queued",
+            progress=0,
+            message="Video uploaded, waiting to process..."
+        )
         
         # Start background processing
         asyncio.create_task(
-            self.video_processor.process_video(video_id, str(video_path), speed_kmh)
+            self.video_processor.process_video(
+                video_id, str(video_path), speed_kmh, "compact" if compact_results else "full", geotag
+            )
         )
         
         # Give a brief moment for WebSocket to potentially connect
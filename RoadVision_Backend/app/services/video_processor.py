@@ -2,7 +2,6 @@
 # Optimized for GPU with PyTorch model
 
 import cv2
-import json
 import asyncio
 import logging
 import torch
@@ -14,9 +13,16 @@ from ultralytics import YOLO
 from concurrent.futures import ThreadPoolExecutor
 
 from app.ws.websocket_manager import manager
-from app.core.storage import processing_status, detection_results, RESULTS_DIR, update_global_map
+from app.core.storage import (
+    processing_status, detection_results, RESULTS_DIR, update_global_map,
+    set_job_status, aset_job_status, update_job_status, record_result, get_result_path,
+    write_json, aread_json, run_io
+)
+from app.core.frame_source import FrameGeometry, MODEL_INPUT_WIDTH, open_frame_source
+from app.core.frame_ring import SharedMemoryFrameSource
 from app.services.satellite_sentinel import satellite_sentinel
-from typing import Dict
+from app.services.tiled_inference import TiledDetector, TILE_MIN_ROI_WIDTH
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -57,10 +63,142 @@ DETECTION_TIME_WINDOW = 1.0
 CONFIDENCE_THRESHOLD = 0.80
 DEVICE = "cuda:0" if torch.cuda.is_available() else "cpu"
 
+# Decode in a child process and hand frames over through a shared-memory ring
+DECODE_IN_SUBPROCESS = False
+
+# Tiled inference for 4K UAV footage: "auto" (by ROI width), "on" or "off"
+TILED_INFERENCE = "auto"
+
+# Scene-change gating: skip YOLO on frames whose road surface has not changed
+MOTION_GATE_ENABLED = True
+MOTION_GATE_SIZE = (64, 32)          # Thumbnail (w, h) used for frame differencing
+MOTION_GATE_THRESHOLD = 2.0          # Mean absolute grey-level difference (0-255)
+MOTION_GATE_MAX_SKIP = 30            # Force a real inference at least this often
+
+# Result size control: "full" keeps every per-frame detection, "compact" keeps
+# per-track keyframe summaries only
+RESULTS_MODE = "full"
+TRAJECTORY_MIN_SHIFT = 0.25          # Centre shift (fraction of bbox size) that starts a new trajectory point
+TRAJECTORY_MIN_AREA_CHANGE = 0.30    # Relative area change that starts a new trajectory point
+
 # Thread pool for blocking operations
 executor = ThreadPoolExecutor(max_workers=4)
 
 
+class SceneChangeGate:
+    """Content-driven pre-filter that detects a stationary vehicle (e.g. Lagos go-slow traffic).
+
+    The ROI is downscaled to a tiny greyscale thumbnail and compared with the thumbnail
+    of the last frame that actually went through YOLO. Comparing against the last
+    *inferred* frame (rather than the previous frame) means slow drift still accumulates
+    until it crosses the threshold.
+    """
+
+    def __init__(self, threshold: float = MOTION_GATE_THRESHOLD, max_skip: int = MOTION_GATE_MAX_SKIP):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped_in_row = 0
+        self.frames_skipped = 0
+        # Detections of the last inferred frame, replayed while the scene is static
+        self.last_detections = []
+
+    @staticmethod
+    def _thumbnail(roi):
+        small = cv2.resize(roi, MOTION_GATE_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def is_static(self, roi) -> bool:
+        """Return True if inference can be skipped for this ROI"""
+        thumb = self._thumbnail(roi)
+        if self.reference is not None and self.skipped_in_row < self.max_skip:
+            diff = float(cv2.absdiff(thumb, self.reference).mean())
+            if diff < self.threshold:
+                self.skipped_in_row += 1
+                self.frames_skipped += 1
+                return True
+        self.reference = thumb
+        self.skipped_in_row = 0
+        return False
+
+
+class PotholeTrackLog:
+    """Per-track keyframe summaries of confirmed potholes.
+
+    Instead of one entry per pothole per frame, each track keeps its first, last and
+    best-confidence observation, its maximum severity and a bbox trajectory that is only
+    sampled when the box moves or grows noticeably.
+    """
+
+    SEVERITY_RANK = {"LOW": 0, "MEDIUM": 1, "CRITICAL": 2}
+
+    def __init__(self):
+        self.tracks: Dict[int, dict] = {}
+
+    @staticmethod
+    def _keyframe(d):
+        return {
+            "frame_id": d["frame_id"],
+            "confidence": d["confidence"],
+            "severity": d["severity"],
+            "bbox": d["bbox"]
+        }
+
+    @staticmethod
+    def _is_change_point(prev, d):
+        pb, b = prev["bbox"], d["bbox"]
+        pw, ph = max(1, pb["x2"] - pb["x1"]), max(1, pb["y2"] - pb["y1"])
+        dx = abs((b["x1"] + b["x2"]) - (pb["x1"] + pb["x2"])) / 2
+        dy = abs((b["y1"] + b["y2"]) - (pb["y1"] + pb["y2"])) / 2
+        prev_area = pw * ph
+        area_change = abs(d["area"] - prev_area) / prev_area
+        return (
+            dx > TRAJECTORY_MIN_SHIFT * pw or dy > TRAJECTORY_MIN_SHIFT * ph
+            or area_change > TRAJECTORY_MIN_AREA_CHANGE
+        )
+
+    def observe(self, detections):
+        """Fold one frame's confirmed detections into the track summaries"""
+        for d in detections:
+            track = self.tracks.get(d["pothole_id"])
+            if track is None:
+                keyframe = self._keyframe(d)
+                self.tracks[d["pothole_id"]] = {
+                    "pothole_id": d["pothole_id"],
+                    "first_frame": keyframe,
+                    "last_frame": keyframe,
+                    "best_frame": keyframe,
+                    "max_severity": d["severity"],
+                    "observations": 1,
+                    "trajectory": [{"frame_id": d["frame_id"], "bbox": d["bbox"]}]
+                }
+                continue
+
+            track["observations"] += 1
+            track["last_frame"] = self._keyframe(d)
+            if d["confidence"] > track["best_frame"]["confidence"]:
+                track["best_frame"] = track["last_frame"]
+            if self.SEVERITY_RANK[d["severity"]] > self.SEVERITY_RANK[track["max_severity"]]:
+                track["max_severity"] = d["severity"]
+            if self._is_change_point(track["trajectory"][-1], d):
+                track["trajectory"].append({"frame_id": d["frame_id"], "bbox": d["bbox"]})
+
+    def first_severity(self, pothole_id) -> str:
+        return self.tracks[pothole_id]["first_frame"]["severity"]
+
+    def summaries(self):
+        """Track summaries ordered by first appearance; trajectories end on the last frame"""
+        out = []
+        for track in sorted(self.tracks.values(), key=lambda t: t["first_frame"]["frame_id"]):
+            last = track["last_frame"]
+            if track["trajectory"][-1]["frame_id"] != last["frame_id"]:
+                track = {**track, "trajectory": track["trajectory"] + [
+                    {"frame_id": last["frame_id"], "bbox": last["bbox"]}
+                ]}
+            out.append(track)
+        return out
+
+
 class VideoProcessor:
     def __init__(self):
         """Initialize video processor with YOLO model on GPU"""
@@ -121,47 +259,89 @@ class VideoProcessor:
         score = (density * 50) + critical_weight + medium_weight
         return min(100, round(score, 2))
 
-    def detect_frame(self, frame, frame_id, results_log, tracker, confirmed, current_time, speed):
-        """Detect potholes in a single frame with tracking"""
+    @staticmethod
+    def _replay_static_frame(gate, frame_id, results_log, tracker, current_time, speed, roi_ratio):
+        """Carry tracker state forward for a frame skipped by the scene-change gate"""
+        if not gate.last_detections:
+            return 0, 0
+
+        detections = []
+        for d in gate.last_detections:
+            # Keep the confirmation window alive for tracks that are still in view
+            tracker[d["pothole_id"]].append(current_time)
+            detections.append({**d, "frame_id": frame_id})
+
+        VideoProcessor._log_frame(results_log, frame_id, speed, roi_ratio, detections)
+        return len(detections), 0
+
+    @staticmethod
+    def _log_frame(results_log, frame_id, speed, roi_ratio, detections):
+        """Record a frame with confirmed detections in the track log (and full log if kept)"""
+        results_log["frames_with_detections"] += 1
+        results_log["tracks"].observe(detections)
+        if results_log["frames"] is not None:
+            results_log["frames"].append({
+                "frame_id": frame_id,
+                "speed_kmh": speed,
+                "roi_ratio": roi_ratio,
+                "potholes": detections
+            })
+
+    def _track_full_roi(self, roi, conf):
+        """Single-pass tracking of the whole ROI at imgsz=640"""
+        results = self.model.track(
+            roi,
+            conf=conf,
+            tracker=TRACKER,
+            persist=True,
+            verbose=False,
+            device=DEVICE,
+            imgsz=640
+        )
+        
+        for r in results:
+            if r.boxes is None or len(r.boxes) == 0 or r.boxes.id is None:
+                continue
+            yield r.boxes.xyxy.cpu().numpy(), r.boxes.id.cpu().numpy(), r.boxes.conf.cpu().numpy()
+
+    def detect_frame(self, frame, frame_id, results_log, tracker, confirmed, current_time, speed,
+                     gate=None, tiler=None, geometry=None):
+        """Detect potholes in a single frame with tracking.
+
+        When `geometry` is given the frame is an ROI already cropped (and possibly
+        downscaled) by the frame source; boxes are mapped back to source pixels.
+        """
         h, w = frame.shape[:2]
         params = self.get_adaptive_params(speed)
         
         # ROI extraction
-        roi_y = int(h * (1 - params["roi_ratio"]))
-        roi = frame[roi_y:h, :]
+        if geometry is None:
+            geometry = FrameGeometry(crop_top=int(h * (1 - params["roi_ratio"])))
+            roi = frame[geometry.crop_top:h, :]
+        else:
+            roi = frame
+
+        if gate is not None and gate.is_static(roi):
+            return self._replay_static_frame(
+                gate, frame_id, results_log, tracker, current_time, speed, params["roi_ratio"]
+            )
         
         detections = []
         count = 0
         new_count = 0
         
         try:
-            results = self.model.track(
-                roi,
-                conf=params["conf"],
-                tracker=TRACKER,
-                persist=True,
-                verbose=False,
-                device=DEVICE,
-                imgsz=640
-            )
+            if tiler is not None:
+                tracked = [tiler.track(self.model, roi, params["conf"], DEVICE)]
+            else:
+                tracked = self._track_full_roi(roi, params["conf"])
             
-            for r in results:
-                if r.boxes is None or len(r.boxes) == 0:
-                    continue
-                    
-                boxes = r.boxes.xyxy.cpu().numpy()
-                confs = r.boxes.conf.cpu().numpy()
-                ids = r.boxes.id.cpu().numpy() if r.boxes.id is not None else None
-                
-                if ids is None:
-                    continue
-                
+            for boxes, ids, confs in tracked:
                 for box, track_id, conf in zip(boxes, ids, confs):
-                    x1, y1, x2, y2 = map(int, box)
                     track_id = int(track_id)
                     
                     # Adjust coordinates
-                    y1_full, y2_full = y1 + roi_y, y2 + roi_y
+                    x1, y1_full, x2, y2_full = geometry.to_source(*box)
                     
                     # Update tracker
                     tracker[track_id].append(current_time)
@@ -205,87 +385,99 @@ class VideoProcessor:
                         })
             
             if detections:
-                results_log["frames"].append({
-                    "frame_id": frame_id,
-                    "speed_kmh": speed,
-                    "roi_ratio": params["roi_ratio"],
-                    "potholes": detections
-                })
+                self._log_frame(results_log, frame_id, speed, params["roi_ratio"], detections)
                 
         except Exception as e:
             logger.error(f"Detection error: {e}")
+
+        if gate is not None:
+            gate.last_detections = detections
         
         return count, new_count
 
-    def _process_video_blocking(self, video_id: str, video_path: str, speed: int, loop):
+    @staticmethod
+    def geotag_position(geotag: Optional[Dict], time_s: float, duration: float) -> Optional[Dict]:
+        """Position at a point in the video: the start fix, or linear interpolation to the
+        end fix when the upload supplied both"""
+        if not geotag:
+            return None
+        lat, lon = geotag["lat"], geotag["lon"]
+        if geotag.get("end_lat") is not None and geotag.get("end_lon") is not None and duration > 0:
+            f = min(max(time_s / duration, 0.0), 1.0)
+            lat += (geotag["end_lat"] - lat) * f
+            lon += (geotag["end_lon"] - lon) * f
+        return {"lat": round(lat, 6), "lon": round(lon, 6)}
+
+    def _process_video_blocking(self, video_id: str, video_path: str, speed: int, loop,
+                                results_mode: str = RESULTS_MODE, geotag: Optional[Dict] = None):
         """Process video in blocking thread"""
+        source = None
+        frame = None
         try:
-            asyncio.run_coroutine_threadsafe(
-                manager.send_message(video_id, {"type": "status", "status": "processing", "progress": 0}),
-                loop
-            )
+            manager.publish_threadsafe(video_id, {"type": "status", "status": "processing", "progress": 0}, loop)
             
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("Could not open video")
-            
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            roi_ratio = self.get_adaptive_params(speed)["roi_ratio"]
+            if DECODE_IN_SUBPROCESS:
+                source = SharedMemoryFrameSource(video_path, roi_ratio=roi_ratio)
+            else:
+                source = open_frame_source(video_path, roi_ratio=roi_ratio)
+            fps = source.fps
+            total_frames = source.total_frames
+            width = source.width
+            height = source.height
+
+            # Tiled inference needs full-resolution ROIs; otherwise decode at model input size
+            use_tiles = TILED_INFERENCE == "on" or (TILED_INFERENCE == "auto" and width >= TILE_MIN_ROI_WIDTH)
+            source.negotiate(None if use_tiles else MODEL_INPUT_WIDTH)
             
-            logger.info(f"Processing {video_id}: {total_frames} frames @ {fps:.1f} FPS")
+            logger.info(f"Processing {video_id}: {total_frames} frames @ {fps:.1f} FPS ({source.backend} decode)")
             
-            results_log = {"frames": []}
+            results_log = {
+                "frames": None if results_mode == "compact" else [],
+                "tracks": PotholeTrackLog(),
+                "frames_with_detections": 0
+            }
             tracker = defaultdict(lambda: deque(maxlen=20))
             confirmed = {}
             severity_counts = {"LOW": 0, "MEDIUM": 0, "CRITICAL": 0}
             total_detections = 0
             frame_count = 0
             last_progress = 0
+            gate = SceneChangeGate() if MOTION_GATE_ENABLED else None
+            tiler = TiledDetector(TRACKER, frame_rate=int(round(fps)) or 30) if use_tiles else None
             
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
+            for frame in source:
                 frame_count += 1
                 current_time = frame_count / fps
                 
                 n, new_found = self.detect_frame(
-                    frame, frame_count, results_log, tracker, confirmed, current_time, speed
+                    frame, frame_count, results_log, tracker, confirmed, current_time, speed,
+                    gate, tiler, source.geometry
                 )
                 total_detections += n
                 
                 # Check for newly confirmed pothole and update severity counts
                 if new_found:
                     latest_pothole_id = max(confirmed.keys())
-                    # We need to know the severity of the newly confirmed pothole
-                    # Simplified: find it in results_log
-                    for f in reversed(results_log["frames"]):
-                        for p in f["potholes"]:
-                            if p["pothole_id"] == latest_pothole_id:
-                                severity_counts[p["severity"]] += 1
-                                break
-                        else: continue
-                        break
+                    if latest_pothole_id in results_log["tracks"].tracks:
+                        severity_counts[results_log["tracks"].first_severity(latest_pothole_id)] += 1
                 
                 # Progress update every 5%
                 progress = int((frame_count / total_frames) * 100)
                 if progress - last_progress >= 5:
-                    processing_status[video_id]["progress"] = progress
-                    asyncio.run_coroutine_threadsafe(
-                        manager.send_message(video_id, {
-                            "type": "progress",
-                            "progress": progress,
-                            "unique_potholes": len(confirmed),
-                            "total_detections": total_detections
-                        }),
-                        loop
-                    )
+                    update_job_status(video_id, progress=progress)
+                    manager.publish_threadsafe(video_id, {
+                        "type": "progress",
+                        "progress": progress,
+                        "unique_potholes": len(confirmed),
+                        "total_detections": total_detections
+                    }, loop)
                     last_progress = progress
             
-            cap.release()
+            # The last frame may be a view into the decoder's shared memory
+            frame = None
+            source.release()
+            source = None
             torch.cuda.empty_cache() if torch.cuda.is_available() else None
             
             # Build results
@@ -298,8 +490,12 @@ class VideoProcessor:
                 }
                 for pid, info in confirmed.items()
             ], key=lambda x: x["first_detected_frame"])
+            if geotag:
+                duration = total_frames / fps if fps else 0
+                for p in pothole_list:
+                    p.update(self.geotag_position(geotag, p["first_detected_time"], duration))
             
-            frames_with_detections = len(results_log["frames"])
+            frames_with_detections = results_log["frames_with_detections"]
             detection_rate = round((frames_with_detections / frame_count) * 100, 2) if frame_count > 0 else 0
             urgency_score = self.calculate_urgency_score(len(confirmed), frame_count, severity_counts)
             
@@ -315,7 +511,8 @@ class VideoProcessor:
                     "duration": round(total_frames / fps, 2),
                     "width": width,
                     "height": height,
-                    "resolution": f"{width}x{height}"
+                    "resolution": f"{width}x{height}",
+                    "inference_mode": "tiled" if tiler else "full"
                 },
                 "summary": {
                     "total_frames": frame_count,
@@ -323,31 +520,34 @@ class VideoProcessor:
                     "total_detections": total_detections,
                     "frames_with_detections": frames_with_detections,
                     "detection_rate": detection_rate,
+                    "frames_skipped_static": gate.frames_skipped if gate else 0,
                     "severity_breakdown": severity_counts
                 },
+                "results_mode": results_mode,
+                "geotag": geotag,
                 "pothole_list": pothole_list,
-                "frames": results_log["frames"],
+                "tracks": results_log["tracks"].summaries(),
                 "mitigation_plan": LagosTrafficMitigator.generate_mitigation_plan(
                     {"urgency_score": urgency_score, "summary": {"severity_breakdown": severity_counts}}
                 )
             }
             
-            detection_results[video_id] = results
+            if results_log["frames"] is not None:
+                results["frames"] = results_log["frames"]
+            
             update_global_map(pothole_list, video_id)
             
-            with open(RESULTS_DIR / f"{video_id}.json", 'w') as f:
-                json.dump(results, f, indent=2)
+            result_path = RESULTS_DIR / f"{video_id}.json"
+            write_json(result_path, results)
+            record_result(video_id, results, result_path)
             
-            processing_status[video_id] = {"status": "completed", "progress": 100}
+            set_job_status(video_id, status="completed", progress=100)
             
-            asyncio.run_coroutine_threadsafe(
-                manager.send_message(video_id, {
-                    "type": "complete",
-                    "status": "completed",
-                    "summary": results["summary"]
-                }),
-                loop
-            )
+            manager.publish_threadsafe(video_id, {
+                "type": "complete",
+                "status": "completed",
+                "summary": results["summary"]
+            }, loop)
             
             # Detailed logging
             unique_ids = sorted([p["pothole_id"] for p in pothole_list])
@@ -355,6 +555,9 @@ class VideoProcessor:
             logger.info(f"VIDEO PROCESSING COMPLETE: {video_id}")
             logger.info(f"Total frames: {frame_count}")
             logger.info(f"Total detections: {total_detections}")
+            logger.info(f"Static frames skipped: {results['summary']['frames_skipped_static']}")
+            if tiler:
+                logger.info(f"Tiles inferred: {tiler.tiles_run} | Tiles skipped: {tiler.tiles_skipped}")
             logger.info(f">>> UNIQUE POTHOLES: {len(confirmed)} <<<")
             logger.info(f"Pothole IDs: {unique_ids}")
             logger.info("=" * 60)
@@ -371,34 +574,34 @@ class VideoProcessor:
             
         except Exception as e:
             logger.error(f"Error processing {video_id}: {e}")
-            processing_status[video_id] = {"status": "error", "message": str(e)}
-            asyncio.run_coroutine_threadsafe(
-                manager.send_message(video_id, {"type": "error", "message": str(e)}),
-                loop
-            )
+            frame = None
+            if source is not None:
+                source.release()
+            set_job_status(video_id, status="error", message=str(e))
+            manager.publish_threadsafe(video_id, {"type": "error", "message": str(e)}, loop)
             raise
 
-    async def process_video(self, video_id: str, video_path: str, speed_kmh: int):
+    async def process_video(self, video_id: str, video_path: str, speed_kmh: int,
+                            results_mode: str = RESULTS_MODE, geotag: Optional[Dict] = None):
         """Async video processing"""
-        processing_status[video_id] = {"status": "processing", "progress": 0}
+        await aset_job_status(video_id, status="processing", progress=0)
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(
-            executor, self._process_video_blocking, video_id, video_path, speed_kmh, loop
+            executor, self._process_video_blocking, video_id, video_path, speed_kmh, loop, results_mode, geotag
         )
 
     async def get_status(self, video_id: str):
         """Get processing status"""
-        if video_id not in processing_status:
+        status = await run_io(processing_status.get, video_id)
+        if status is None:
             raise HTTPException(status_code=404, detail="Video ID not found")
-        return processing_status[video_id]
+        return status
 
     async def get_results(self, video_id: str):
         """Get detection results"""
         if video_id not in detection_results:
-            result_file = RESULTS_DIR / f"{video_id}.json"
-            if result_file.exists():
-                with open(result_file, 'r') as f:
-                    detection_results[video_id] = json.load(f)
-            else:
+            results = await aread_json(await run_io(get_result_path, video_id))
+            if results is None:
                 raise HTTPException(status_code=404, detail="Results not found")
+            detection_results[video_id] = results
         return detection_results[video_id]
\ No newline at end of file
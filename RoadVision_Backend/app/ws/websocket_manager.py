@@ -1,66 +1,257 @@
 # app/ws/websocket_manager.py
 
 from fastapi import WebSocket
-from typing import Dict, List
+from collections import deque
+from typing import Dict, Set
+import asyncio
 import logging
+import threading
+
+from app.core.state_backend import state_backend
+from app.core.serialization import dumps
 
 logger = logging.getLogger(__name__)
 
+# Configuration
+SUBSCRIBER_QUEUE_SIZE = 64
+COALESCED_TYPES = {"progress", "heartbeat"}     # Only the latest pending value is kept
+CRITICAL_TYPES = {"complete", "error"}          # Never dropped for slow consumers
+SEND_TIMEOUT = 10.0                             # A socket write slower than this evicts the client
+COMMAND_LINK_QUEUE_SIZE = 256
+COMMAND_LINK_HEARTBEAT = 20.0                   # Idle seconds before a heartbeat is sent
+VIDEO_CHANNEL_PREFIX = "video:"
+COMMAND_LINK_CHANNEL = "command-link"
+
+
+class Subscriber:
+    """One WebSocket with its own bounded send queue and sender task.
+
+    Publishers only enqueue pre-encoded text, so a slow client never blocks the
+    publisher or other subscribers. Coalescable messages (progress) replace any pending
+    message of the same type. When the queue is full, the "drop_oldest" policy drops the
+    oldest non-critical message while "evict" disconnects the slow consumer. Writes that
+    exceed SEND_TIMEOUT also evict, and an optional heartbeat is sent when idle.
+    """
+
+    def __init__(self, websocket: WebSocket, maxsize: int = SUBSCRIBER_QUEUE_SIZE,
+                 drop_policy: str = "drop_oldest", heartbeat_interval: float = None, on_close=None):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.heartbeat_interval = heartbeat_interval
+        self.on_close = on_close
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+        self.dropped = 0
+        self.closed = False
+        self.evicted = False
+
+    def offer(self, kind: str, text: str) -> bool:
+        """Enqueue an encoded message; returns False if the subscriber is closed"""
+        if self.closed:
+            return False
+
+        if kind in COALESCED_TYPES:
+            for i, (pending_kind, _) in enumerate(self.queue):
+                if pending_kind == kind:
+                    self.queue[i] = (kind, text)
+                    return True
+
+        if len(self.queue) >= self.maxsize:
+            if self.drop_policy == "evict":
+                logger.warning("Evicting slow WebSocket consumer (send queue full)")
+                self.evicted = True
+                self.close()
+                return False
+            for i, (pending_kind, _) in enumerate(self.queue):
+                if pending_kind not in CRITICAL_TYPES:
+                    del self.queue[i]
+                    self.dropped += 1
+                    break
+
+        self.queue.append((kind, text))
+        self.idle.clear()
+        self.wakeup.set()
+        return True
+
+    def send(self, message: dict) -> bool:
+        """Encode and enqueue a message for this subscriber only"""
+        return self.offer(message.get("type", ""), dumps(message).decode())
+
+    async def run(self):
+        """Sender loop: drain the queue to the socket until closed or the socket fails"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self.idle.set()
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), self.heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        self.send({"type": "heartbeat"})
+                    continue
+                _, text = self.queue.popleft()
+                await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning("Evicting stalled WebSocket consumer (send timeout)")
+            self.evicted = True
+        except Exception as e:
+            logger.error(f"WebSocket send failed: {e}")
+        finally:
+            self.closed = True
+            self.queue.clear()
+            self.idle.set()
+            if self.on_close:
+                self.on_close(self)
+            if self.evicted:
+                # Tell the client so it can reconnect (and reload history) instead of going silent
+                try:
+                    await asyncio.wait_for(self.websocket.close(code=1013), 1.0)
+                except Exception:
+                    pass
+
+    async def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far has been written to the socket"""
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+
 class ConnectionManager:
     """Enhanced WebSocket manager for specific videos and Global Command Link"""
-    
+
     def __init__(self):
-        # Video-specific connections
-        self.active_connections: Dict[str, WebSocket] = {}
-        # Global command link connections
-        self.command_link_connections: List[WebSocket] = []
+        # Video-specific subscribers (fan-out to every viewer of a video)
+        self.active_connections: Dict[str, Set[Subscriber]] = {}
+        # Global command link subscribers
+        self.command_link_connections: Set[Subscriber] = set()
+        # Messages handed over from worker threads, drained on the event loop in batches
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._drain_scheduled = False
+        # Messages are routed through the state backend so every node's sockets see them
+        state_backend.add_listener(self._on_backend_message)
 
-    async def connect(self, video_id: str, websocket: WebSocket):
-        """Accept and store WebSocket connection for a specific video"""
+    def _on_backend_message(self, channel: str, message: dict):
+        if channel.startswith(VIDEO_CHANNEL_PREFIX):
+            self._deliver(channel[len(VIDEO_CHANNEL_PREFIX):], message)
+        elif channel == COMMAND_LINK_CHANNEL:
+            self._deliver_command_link(message)
+
+    async def connect(self, video_id: str, websocket: WebSocket) -> Subscriber:
+        """Accept a WebSocket and subscribe it to a specific video"""
         await websocket.accept()
-        self.active_connections[video_id] = websocket
+        subscriber = Subscriber(websocket, on_close=lambda s: self.disconnect(video_id, s))
+        subscriber.task = asyncio.create_task(subscriber.run())
+        self.active_connections.setdefault(video_id, set()).add(subscriber)
         logger.info(f"WebSocket connected for video: {video_id}")
+        return subscriber
 
-    def disconnect(self, video_id: str):
-        """Remove specific video WebSocket connection"""
-        if video_id in self.active_connections:
-            del self.active_connections[video_id]
+    def disconnect(self, video_id: str, subscriber: Subscriber):
+        """Remove one subscriber of a video"""
+        subscribers = self.active_connections.get(video_id)
+        if subscribers and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.active_connections[video_id]
             logger.info(f"WebSocket disconnected for video: {video_id}")
+        subscriber.close()
 
-    async def connect_command_link(self, websocket: WebSocket):
+    async def connect_command_link(self, websocket: WebSocket) -> Subscriber:
         """Connect to the global real-time communication channel"""
         await websocket.accept()
-        self.command_link_connections.append(websocket)
+        subscriber = Subscriber(
+            websocket,
+            maxsize=COMMAND_LINK_QUEUE_SIZE,
+            drop_policy="evict",
+            heartbeat_interval=COMMAND_LINK_HEARTBEAT,
+            on_close=self.disconnect_command_link
+        )
+        subscriber.task = asyncio.create_task(subscriber.run())
+        self.command_link_connections.add(subscriber)
         logger.info("New peer connected to Sentinel Command Link")
+        return subscriber
 
-    def disconnect_command_link(self, websocket: WebSocket):
+    def disconnect_command_link(self, subscriber: Subscriber):
         """Disconnect from global channel"""
-        if websocket in self.command_link_connections:
-            self.command_link_connections.remove(websocket)
+        if subscriber in self.command_link_connections:
+            self.command_link_connections.discard(subscriber)
             logger.info("Peer disconnected from Command Link")
+        subscriber.close()
+
+    def publish(self, video_id: str, message: dict):
+        """Route a message to every subscriber of a video, on every node (event loop only)"""
+        state_backend.publish(VIDEO_CHANNEL_PREFIX + video_id, message)
+
+    def _deliver(self, video_id: str, message: dict):
+        """Fan a message out to this node's subscribers of a video.
+
+        The message is encoded once; delivery happens in each subscriber's sender task.
+        """
+        subscribers = self.active_connections.get(video_id)
+        if not subscribers:
+            return
+        text = dumps(message).decode()
+        kind = message.get("type", "")
+        for subscriber in list(subscribers):
+            if not subscriber.offer(kind, text):
+                self.disconnect(video_id, subscriber)
+
+    def publish_threadsafe(self, video_id: str, message: dict, loop: asyncio.AbstractEventLoop):
+        """Publish from a worker thread.
+
+        Messages are buffered and a single drain callback is scheduled on the loop per
+        batch, instead of one cross-thread coroutine hand-off per message.
+        """
+        with self._pending_lock:
+            self._pending.append((video_id, message))
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        loop.call_soon_threadsafe(self._drain_pending)
+
+    def _drain_pending(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            self._drain_scheduled = False
+        state_backend.publish_many([
+            (VIDEO_CHANNEL_PREFIX + video_id, message) for video_id, message in batch
+        ])
 
     async def send_message(self, video_id: str, message: dict):
-        """Send message to specific video's WebSocket"""
-        if video_id in self.active_connections:
-            try:
-                await self.active_connections[video_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message to {video_id}: {str(e)}")
-                self.disconnect(video_id)
+        """Send message to all of a video's subscribers"""
+        self.publish(video_id, message)
 
     async def broadcast_command_link(self, message: dict):
-        """Broadcast message to all command link participants"""
-        for connection in self.command_link_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to command link: {e}")
-                self.command_link_connections.remove(connection)
+        """Broadcast message to all command link participants on every node"""
+        state_backend.publish(COMMAND_LINK_CHANNEL, message)
+
+    def _deliver_command_link(self, message: dict):
+        """Deliver a command link message to this node's participants.
+
+        Encoded once and enqueued on every client's send queue; clients are written to
+        concurrently by their own sender tasks, so a stalled browser delays nobody else.
+        """
+        text = dumps(message).decode()
+        kind = message.get("type", "")
+        for subscriber in list(self.command_link_connections):
+            if not subscriber.offer(kind, text):
+                self.disconnect_command_link(subscriber)
 
     async def broadcast(self, message: dict):
         """Legacy broadcast to all video-specific connections"""
         for video_id in list(self.active_connections.keys()):
-            await self.send_message(video_id, message)
+            self.publish(video_id, message)
 
 # Global manager instance
 manager = ConnectionManager()
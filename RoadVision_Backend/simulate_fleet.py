@@ -0,0 +1,91 @@
+# simulate_fleet.py - Stream telemetry from a simulated drone fleet to a running backend
+# Usage: python simulate_fleet.py [base_url] [drones] [reports/s per drone] [seconds] [http|ws]
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+import requests
+
+from app.services.uav_telemetry import TELEMETRY_DTYPE
+
+base_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000/api/v1"
+drones = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+rate_hz = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+duration = float(sys.argv[4]) if len(sys.argv) > 4 else 10.0
+transport = sys.argv[5] if len(sys.argv) > 5 else "http"
+
+ISSUE_PROBABILITY = 0.0005
+BATCH_INTERVAL = 0.05           # Seconds of readings per batch
+
+rng = np.random.default_rng()
+lat = rng.uniform(6.40, 6.70, drones)
+lon = rng.uniform(3.10, 3.60, drones)
+battery = np.full(drones, 100.0)
+
+
+def next_batch() -> bytes:
+    """BATCH_INTERVAL worth of readings for the whole fleet"""
+    per_drone = max(1, int(np.ceil(rate_hz * BATCH_INTERVAL)))
+    records = np.zeros(drones * per_drone, dtype=TELEMETRY_DTYPE)
+    now = time.time()
+    for k in range(per_drone):
+        lat[:] += rng.normal(0, 2e-5, drones)
+        lon[:] += rng.normal(0, 2e-5, drones)
+        battery[:] = np.maximum(0, battery - 0.001)
+        chunk = records[k * drones:(k + 1) * drones]
+        chunk["uav"] = np.arange(drones)
+        chunk["ts"] = now - BATCH_INTERVAL + (k + 1) * BATCH_INTERVAL / per_drone
+        chunk["lat"], chunk["lon"], chunk["battery"] = lat, lon, battery
+        chunk["status"] = 0
+        chunk["issue"] = np.where(rng.random(drones) < ISSUE_PROBABILITY, rng.integers(1, 5, drones), 0)
+    return records.tobytes()
+
+
+def run_http() -> int:
+    session = requests.Session()
+    headers = {"Content-Type": "application/octet-stream"}
+    sent = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        started = time.time()
+        body = next_batch()
+        response = session.post(f"{base_url}/uav/telemetry", data=body, headers=headers)
+        response.raise_for_status()
+        sent += response.json()["accepted"]
+        time.sleep(max(0.0, BATCH_INTERVAL - (time.time() - started)))
+    return sent
+
+
+async def run_ws() -> int:
+    import websockets
+
+    sent = 0
+    url = base_url.replace("http", "ws", 1) + "/ws/uav-telemetry"
+    async with websockets.connect(url) as ws:
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            started = time.time()
+            body = next_batch()
+            await ws.send(body)
+            sent += len(body) // TELEMETRY_DTYPE.itemsize
+            await asyncio.sleep(max(0.0, BATCH_INTERVAL - (time.time() - started)))
+    return sent
+
+
+print(f"\n{'='*60}")
+print(f"FLEET SIMULATOR: {drones} drones x {rate_hz:g} Hz over {transport} -> {base_url}")
+print(f"{'='*60}")
+
+start = time.time()
+sent = asyncio.run(run_ws()) if transport == "ws" else run_http()
+elapsed = time.time() - start
+
+status = requests.get(f"{base_url}/uav/swarm-status").json()
+alerts = requests.get(f"{base_url}/uav/critical-alerts").json()
+print(f"  Records sent:     {sent}")
+print(f"  Throughput:       {sent / elapsed:.0f} records/s (target {drones * rate_hz:.0f})")
+print(f"  Server telemetry: {status['telemetry']}")
+print(f"  Active alerts:    {len(alerts)}")
+print(f"{'='*60}\n")